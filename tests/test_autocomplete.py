@@ -0,0 +1,19 @@
+from web import autocomplete
+
+
+def test_name_index_prefix_lookup(monkeypatch):
+	cards = [
+		{'id': 1, 'name': 'Lim-Dûl the Necromancer'},
+		{'id': 2, 'name': 'Fire // Ice'},
+	]
+	monkeypatch.setattr(autocomplete, 'fetch_query', lambda *args: cards)
+	index = autocomplete.NameIndex()
+
+	assert([c['id'] for c in index.lookup('lim-dul')] == [1])
+	assert([c['id'] for c in index.lookup('ICE')] == [2])
+	assert(index.lookup('fire //') == [{'id': 2, 'name': 'Fire // Ice'}])
+	assert(index.lookup('nothing') == [])
+
+	# Newly imported cards are found straight away
+	index.add([{'id': 3, 'name': 'Icequake'}])
+	assert([c['id'] for c in index.lookup('ice')] == [2, 3])
@@ -0,0 +1,26 @@
+import io
+
+from flask import request
+
+from web import app, collection
+
+
+def test_read_csv_from_upload():
+	header = 'Quantity,Scryfall ID,Foil quantity\n'
+	lines = ['{},id-{},{}\n'.format(i % 4 + 1, i, i % 2) for i in range(50000)]
+	# Big enough for Werkzeug to spool the upload to a temporary file, as it
+	# does for real uploads, rather than keep it in memory
+	data = (header + ''.join(lines)).encode('utf-8-sig')
+	assert(len(data) > 500 * 1024)
+
+	with app.test_request_context(
+		'/csv_upload',
+		method='POST',
+		data={'upload': (io.BytesIO(data), 'collection.csv')},
+		content_type='multipart/form-data'
+	):
+		rows = collection.read_csv(request.files['upload'].stream)
+
+	assert(len(rows) == 50000)
+	assert(rows[0] == {'scryfallid': 'id-0', 'foil': False, 'quantity': 1})
+	assert(rows[1] == {'scryfallid': 'id-1', 'foil': True, 'quantity': 2})
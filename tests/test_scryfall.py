@@ -0,0 +1,14 @@
+import json
+
+from web import scryfall
+
+
+def test_iter_bulk_file(tmpdir, monkeypatch):
+	# Force several reads per card to exercise the incremental parsing
+	monkeypatch.setattr(scryfall, '_BULK_READ_SIZE', 16)
+	cards = [{'id': str(i), 'name': 'Card, [{}]'.format(i)} for i in range(25)]
+	bulk = tmpdir.join('bulk.json')
+	bulk.write(json.dumps(cards, indent=2))
+
+	assert(list(scryfall.iter_bulk_file(str(bulk))) == cards)
+	assert(list(scryfall.iter_bulk_file(str(bulk), skip=20)) == cards[20:])
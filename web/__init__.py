@@ -1,18 +1,22 @@
 # Standard library imports
-import os
+import datetime
+import functools
+import mimetypes
 
 # Third party imports
+import click
 from flask import (
 	request, session, jsonify, send_from_directory, flash, redirect, url_for,
-	render_template, Flask, Response, got_request_exception
+	render_template, make_response, Flask, Response, got_request_exception
 )
 import rollbar
 import rollbar.contrib.flask
 
 # Local imports
 from web import (
-	collection, deck, scryfall, tcgplayer, config,
-	functions
+	collection, deck, config,
+	functions, catalog, cache, search, autocomplete, images, cardsets,
+	pricehistory
 )
 from flasktools import handle_exception, params_to_dict, serve_static_file
 from flasktools.auth import is_logged_in, check_login, login_required
@@ -22,6 +26,16 @@ app = Flask(__name__)
 
 app.secret_key = config.SECRETKEY
 
+
+def get_send_file_max_age(filename: str) -> int:
+	# Image variants are named by a hash of their content, so never change
+	if filename and images.is_variant(filename):
+		return 60 * 60 * 24 * 365
+	return Flask.get_send_file_max_age(app, filename)
+
+
+app.get_send_file_max_age = get_send_file_max_age
+
 app.jinja_env.globals.update(is_logged_in=is_logged_in)
 app.jinja_env.globals.update(static_file=serve_static_file)
 
@@ -55,6 +69,27 @@ def teardown(e: Exception) -> Response:
 	disconnect_database()
 
 
+def conditional(view: any) -> any:
+	"""
+	Tag the response with an ETag of the user's current data versions, and
+	answer If-None-Match with 304 without running the view while unchanged.
+	"""
+	@functools.wraps(view)
+	def wrapper(*args, **kwargs) -> Response:
+		# Read before running the view, so a change made meanwhile isn't missed
+		tag = cache.etag(session['userid'], request.full_path)
+		if request.if_none_match.contains(tag):
+			resp = Response(status=304)
+		else:
+			resp = make_response(view(*args, **kwargs))
+		resp.set_etag(tag)
+		# Always revalidate, as the data may change at any time
+		resp.cache_control.private = True
+		resp.cache_control.no_cache = True
+		return resp
+	return wrapper
+
+
 @app.route('/ping')
 def ping() -> Response:
 	return jsonify(ping='pong')
@@ -68,6 +103,18 @@ def static_from_root() -> Response:
 	return send_from_directory(app.static_folder, request.path[1:])
 
 
+@app.route('/images/<name>')
+def image(name: str) -> Response:
+	"""Hands image requests to the web server, when IMAGE_SENDFILE is set."""
+	if not getattr(config, 'IMAGE_SENDFILE', None):
+		return redirect(images.url(name))
+	resp = Response(mimetype=mimetypes.guess_type(name)[0])
+	resp.headers.update(images.sendfile_headers(name))
+	resp.cache_control.public = True
+	resp.cache_control.max_age = get_send_file_max_age(name)
+	return resp
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login() -> Response:
 	if is_logged_in():
@@ -102,27 +149,23 @@ def home() -> Response:
 @app.route('/get_sets', methods=['GET'])
 @login_required
 def get_sets() -> Response:
-	sets = fetch_query(
-		"SELECT id, name, code FROM card_set ORDER BY released DESC"
-	)
-	for s in sets:
-		if not os.path.exists(asynchro.set_icon_filename(s['code'])):
-			asynchro.get_set_icon.delay(s['code'])
-		s['iconurl'] = serve_static_file('images/set_icon_{}.svg'.format(s['code']))
-
-	return jsonify(sets=sets)
+	body, tag = cardsets.catalog.get()
+	resp = Response(body, mimetype='application/json')
+	resp.set_etag(tag)
+	resp.cache_control.private = True
+	resp.cache_control.max_age = cardsets.MAX_AGE
+	return resp.make_conditional(request)
 
 
 @app.route('/get_collection', methods=['GET'])
 @login_required
+@conditional
 def get_collection() -> Response:
 	params = params_to_dict(request.args)
 	resp = collection.get(params)
 	for c in resp['cards']:
-		if not os.path.exists(asynchro.card_art_filename(c['id'])):
-			asynchro.get_card_art.delay(c['id'], c['setcode'], c['collectornumber'])
-		if not os.path.exists(asynchro.card_image_filename(c['id'])):
-			asynchro.get_card_image.delay(c['id'], c['setcode'], c['collectornumber'])
+		asynchro.request_card_art(c['id'], c['setcode'], c['collectornumber'])
+		asynchro.request_card_image(c['id'], c['setcode'], c['collectornumber'])
 		del c['id']
 		del c['collectornumber']
 
@@ -131,6 +174,7 @@ def get_collection() -> Response:
 
 @app.route('/collection/card', methods=['GET'])
 @login_required
+@conditional
 def collection_card() -> Response:
 	params = params_to_dict(request.args)
 	resp = {'card': None}
@@ -140,50 +184,54 @@ def collection_card() -> Response:
 			"""
 			SELECT
 				p.id, c.name, cs.name AS setname, get_rarity(p.rarity) AS rarity,
-				uc.quantity, uc.foil, get_price(uc.id) AS price, p.tcgplayer_productid,
-				COALESCE(
-					(SELECT currencycode FROM app.enduser WHERE id = uc.userid),
-					'USD'
-				) AS currencycode,
-				total_printings_owned(uc.userid, p.cardid) AS printingsowned,
-				(
-					SELECT to_char(MAX(created), 'DD/MM/YY')
-					FROM price_history
-					WHERE printingid = p.id
-				) AS price_lastupdated,
+				uc.quantity, uc.foil,
+				%s * r.exchangerate AS price,
+				p.tcgplayer_productid, r.currencycode,
+				COALESCE(o.quantity, 0) AS printingsowned,
+				to_char(p.priceupdated, 'DD/MM/YY') AS price_lastupdated,
 				CASE WHEN p.language != 'en' THEN UPPER(p.language) END AS language
 			FROM user_card uc
 			LEFT JOIN printing p ON (uc.printingid = p.id)
 			LEFT JOIN card c ON (p.cardid = c.id)
 			LEFT JOIN card_set cs ON (p.card_setid = cs.id)
-			WHERE uc.userid = %s
-			AND uc.id = %s
-			""",
+			LEFT JOIN user_card_owned o ON (
+				o.userid = uc.userid AND o.cardid = p.cardid
+			)
+			CROSS JOIN user_currency(uc.userid) r
+			WHERE uc.userid = %%s
+			AND uc.id = %%s
+			""" % collection.BASE_PRICE,
 			(session['userid'], params['user_cardid'],),
 			single_row=True
 		)
 
 	if resp['card']:
 		cardid = resp['card']['id']
-		resp['card']['arturl'] = serve_static_file(f"images/card_art_{cardid}.jpg")
+		art_name = f"card_art_{cardid}.jpg"
+		resp['card']['arturl'] = images.urls([art_name], 'full')[art_name]
 		resp['card']['decks'] = fetch_query(
 			"""
 			SELECT
-				d.name, get_format(d.formatid) AS formatname,
+				d.name, f.name AS formatname,
 				SUM(dc.quantity) AS quantity,
 				d.cardartid
 			FROM deck_card dc
 			LEFT JOIN deck d ON (d.id = dc.deckid)
+			LEFT JOIN format f ON (f.id = d.formatid)
 			WHERE d.deleted = false
 			AND d.userid = %s
 			AND dc.cardid IN (SELECT cardid FROM printing WHERE id = %s)
-			GROUP BY d.id
+			GROUP BY d.id, f.name
 			ORDER BY d.formatid, d.name
 			""",
 			(session['userid'], cardid,)
 		)
+		art_urls = images.urls(
+			[f"card_art_{d['cardartid']}.jpg" for d in resp['card']['decks']],
+			'small'
+		)
 		for d in resp['card']['decks']:
-			d['arturl'] = serve_static_file(f"images/card_art_{d['cardartid']}.jpg")
+			d['arturl'] = art_urls[f"card_art_{d['cardartid']}.jpg"]
 	else:
 		resp['error'] = 'No card selected.'
 
@@ -224,34 +272,26 @@ def collection_card_pricehistory() -> Response:
 		)['printingid']
 
 	if printingid is not None:
-		history = fetch_query(
-			"""
-			SELECT
-				convert_price(ph.price, %s)::NUMERIC AS price,
-				convert_price(ph.foilprice, %s)::NUMERIC AS foilprice,
-				to_char(d.day, 'DD/MM/YY') AS created
-			FROM generate_series(
-				(SELECT MIN(created) FROM price_history WHERE printingid = %s),
-				(SELECT MAX(created) FROM price_history WHERE printingid = %s),
-				'1 day'::INTERVAL
-			) d(day)
-			LEFT JOIN price_history ph ON (ph.created = d.day AND ph.printingid = %s)
-			""",
-			(session['userid'], session['userid'], printingid, printingid, printingid,)
-		)
-
-		resp['dates'] = [h['created'] for h in history]
+		history = {'dates': [], 'price': [], 'foilprice': []}
+		histories = pricehistory.get([printingid], session['userid'])
+		if histories:
+			history = histories[0]
+
+		resp['dates'] = [
+			datetime.date.fromisoformat(d).strftime('%d/%m/%y')
+			for d in history['dates']
+		]
 		prices = {
 			'label': 'Price',
 			'backgroundColor': 'rgba(40, 181, 246, 0.2)',
 			'borderColor': 'rgba(40, 181, 246, 1)',
-			'data': [functions.make_float(h['price']) for h in history]
+			'data': history['price']
 		}
 		foilprices = {
 			'label': 'Foil Price',
 			'backgroundColor': 'rgba(175, 90, 144, 0.2)',
 			'borderColor': 'rgba(175, 90, 144, 1)',
-			'data': [functions.make_float(h['foilprice']) for h in history]
+			'data': history['foilprice']
 		}
 
 		resp['datasets'] = []
@@ -265,6 +305,37 @@ def collection_card_pricehistory() -> Response:
 	return jsonify(**resp)
 
 
+@app.route('/pricehistory', methods=['GET'])
+@login_required
+def price_history() -> Response:
+	"""
+	Downsampled price history of many printings at once, e.g. for charting a
+	whole collection, given comma separated printingids & optionally points.
+	"""
+	params = params_to_dict(request.args)
+	try:
+		printingids = [
+			int(i) for i in str(params['printingids']).split(',')
+		]
+		points = int(params.get('points') or pricehistory.DEFAULT_POINTS)
+	except (KeyError, ValueError):
+		return jsonify(error='Invalid printings or points.'), 400
+	if len(printingids) > pricehistory.MAX_PRINTINGS:
+		return jsonify(error='At most {} printings at once.'.format(
+			pricehistory.MAX_PRINTINGS
+		)), 400
+
+	user_currency = fetch_query(
+		"SELECT currencycode FROM user_currency(%s)",
+		(session['userid'],),
+		single_row=True
+	)
+	return jsonify(
+		currencycode=user_currency['currencycode'],
+		histories=pricehistory.get(printingids, session['userid'], points)
+	)
+
+
 @app.route('/collection/card/add', methods=['POST'])
 @login_required
 def collection_card_add() -> Response:
@@ -300,6 +371,8 @@ def collection_card_edit() -> Response:
 			""",
 			(params['tcgplayer_productid'], existing['printingid'],)
 		)
+		# Printings are shared, so other users' cached responses are stale too
+		cache.bump_global_version()
 	if existing['foil'] != params['foil']:
 		# Foil has changed, need to check for opposite record
 		opposite = fetch_query(
@@ -339,36 +412,53 @@ def collection_card_edit() -> Response:
 				"DELETE FROM user_card WHERE id = %s AND userid = %s",
 				(params['user_cardid'], session['userid'],)
 			)
+	cache.bump_user_version(session['userid'])
 
 	return jsonify()
 
 
 @app.route('/search', methods=['GET'])
 @login_required
-def search() -> Response:
+def search_cards() -> Response:
 	params = params_to_dict(request.args)
 	results = []
 
 	if params.get('query'):
-		search = '%' + params['query'] + '%'
+		filter_qry, filter_args = search.name_filter(params['query'])
+		rank_qry, rank_args = search.name_rank(params['query'])
 		results = fetch_query(
 			"""
 			SELECT
 				p.id, c.name, s.code, s.name AS setname, s.code AS setcode,
 				CASE WHEN p.language != 'en' THEN UPPER(p.language) END AS language,
 				p.collectornumber
-			FROM printing p
-			LEFT JOIN card c ON (p.cardid = c.id)
+			FROM card c
+			JOIN printing p ON (p.cardid = c.id)
 			LEFT JOIN card_set s ON (p.card_setid = s.id)
-			WHERE c.name ILIKE %s
-			ORDER BY c.name ASC, s.released DESC LIMIT 50
-			""",
-			(search,)
+			WHERE {}
+			ORDER BY {} DESC, c.name ASC, s.released DESC LIMIT 50
+			""".format(filter_qry, rank_qry),
+			filter_args + rank_args
+		)
+		image_urls = images.urls(
+			[f"card_image_{r['id']}.jpg" for r in results],
+			'small'
 		)
 		for r in results:
-			if not os.path.exists(asynchro.card_image_filename(r['id'])):
-				asynchro.get_card_image.delay(r['id'], r['setcode'], r['collectornumber'])
-			r['imageurl'] = serve_static_file(f"images/card_image_{r['id']}.jpg")
+			asynchro.request_card_image(r['id'], r['setcode'], r['collectornumber'])
+			r['imageurl'] = image_urls[f"card_image_{r['id']}.jpg"]
+
+	return jsonify(results=results)
+
+
+@app.route('/autocomplete', methods=['GET'])
+@login_required
+def autocomplete_names() -> Response:
+	params = params_to_dict(request.args)
+	results = []
+
+	if params.get('query'):
+		results = autocomplete.index.lookup(params['query'])
 
 	return jsonify(results=results)
 
@@ -376,83 +466,26 @@ def search() -> Response:
 @app.route('/csv_upload', methods=['POST'])
 @login_required
 def csv_upload() -> Response:
-	import csv
-
 	upload = request.files['upload']
-	filename = '/tmp/upload_{}_{}.csv'.format(os.urandom(32), session['userid'])
-	try:
-		upload.save(filename)
-	except FileNotFoundError:
-		return jsonify(error='Error uploading file. Please try again.')
-	rows = []
-	scryfall_ids = []
-	with open(filename) as csvfile:
-		importreader = csv.DictReader(csvfile)
-		for row in importreader:
-			rows.append({
-				'scryfallid': row['Scryfall ID'],
-				'foil': int(row['Foil quantity']) > 0,
-				'quantity': row['Quantity']
-			})
-			scryfall_ids.append(row['Scryfall ID'])
-	os.remove(filename)
-
-	new = []
-	for scryfallid in scryfall_ids:
-		qry = "SELECT 1 FROM printing WHERE scryfallid = %s::TEXT"
-		qargs = (scryfallid,)
-		if len(fetch_query(qry, qargs)) == 0:
-			new.append(scryfallid)
-
-	bulk_lots = ([new[i:i + 75] for i in range(0, len(new), 75)])
-	for lot in bulk_lots:
-		resp = scryfall.get_bulk(lot)
-		collection.import_cards(resp)
-
-	importid = mutate_query(
-		"""
-		INSERT INTO import (filename, userid)
-		VALUES (%s, %s)
-		RETURNING id
-		""",
-		(upload.filename, session['userid'],),
-		returning=True
-	)['id']
-
-	for row in rows:
-		row['printingid'] = fetch_query(
-			"SELECT id FROM printing WHERE scryfallid = %s::TEXT",
-			(row['scryfallid'],),
-			single_row=True
-		)['id']
-		# Doing this in loop instead of executemany due to needing RETURNING
-		row['import_rowid'] = mutate_query(
-			"""
-			INSERT INTO import_row (importid, printingid, foil, quantity)
-			VALUES (%s, %s, %s, %s)
-			RETURNING id
-			""",
-			(importid, row['printingid'], row['foil'], row['quantity'],),
-			returning=True
-		)['id']
+	importid = collection.stage_import(upload.stream, upload.filename)
+	asynchro.run_import.delay(importid)
 
-	complete_import(importid)
+	return jsonify(importid=importid)
 
-	return jsonify(new)
 
+@app.route('/csv_upload/status', methods=['GET'])
+@login_required
+def csv_upload_status() -> Response:
+	params = params_to_dict(request.args)
+	try:
+		importid = int(params['importid'])
+	except (KeyError, TypeError, ValueError):
+		return jsonify(error='Invalid import ID.'), 400
+	status = collection.import_status(importid)
+	if status is None:
+		return jsonify(error='No import found.')
 
-def complete_import(importid: int) -> None:
-	rows = fetch_query(
-		"SELECT * FROM import_row WHERE NOT complete AND importid = %s",
-		(importid,)
-	)
-	for row in rows:
-		collection.add(row['printingid'], row['foil'], row['quantity'])
-		# Mark import for this card as completed
-		mutate_query(
-			"UPDATE import_row SET complete = true WHERE id = %s",
-			(row['id'],)
-		)
+	return jsonify(**status)
 
 
 @app.route('/update_prices', methods=['GET'])
@@ -489,9 +522,25 @@ def _update_prices(printingid=None, missing_prices=False):
 		c.name ASC"""
 	cards = fetch_query(qry, qargs)
 
-	tcgplayer_token = tcgplayer.login()
+	asynchro.fetch_prices.delay(cards)
+
+
+@app.route('/update_catalog', methods=['POST'])
+def update_catalog() -> Response:
+	asynchro.sync_catalog.delay()
+	return jsonify()
+
+
+@app.route('/maintain_price_history', methods=['POST'])
+def maintain_price_history() -> Response:
+	asynchro.maintain_price_history.delay()
+	return jsonify()
+
 
-	asynchro.fetch_prices.delay(cards, tcgplayer_token)
+@app.route('/resume_imports', methods=['POST'])
+def resume_imports() -> Response:
+	asynchro.resume_imports.delay()
+	return jsonify()
 
 
 @app.route('/update_rates', methods=['POST'])
@@ -523,16 +572,20 @@ def decklist(deckid: int) -> Response:
 
 @app.route('/decks/get/all', methods=['GET'])
 @login_required
+@conditional
 def decks_get_all() -> Response:
 	params = params_to_dict(request.args, bool_keys=['deleted'])
 	results = deck.get_all(params['deleted'])
+	art_urls = images.urls(
+		[f"card_art_{r['cardid']}.jpg" for r in results if r['cardid']],
+		'small'
+	)
 	for r in results:
 		if r['cardid']:
-			if not os.path.exists(asynchro.card_art_filename(r['cardid'])):
-				asynchro.get_card_art.delay(r['cardid'], r['code'], r['collectornumber'])
-			r['arturl'] = serve_static_file(f"images/card_art_{r['cardid']}.jpg")
-			del r['code']
-			del r['collectornumber']
+			asynchro.request_card_art(r['cardid'], r['code'], r['collectornumber'])
+			r['arturl'] = art_urls[f"card_art_{r['cardid']}.jpg"]
+		del r['code']
+		del r['collectornumber']
 
 		r['viewurl'] = url_for('decklist', deckid=r['id'])
 		del r['cardid']
@@ -542,21 +595,22 @@ def decks_get_all() -> Response:
 
 @app.route('/decks/get', methods=['GET'])
 @login_required
+@conditional
 def decks_get() -> Response:
 	params = params_to_dict(request.args)
 	resp = {}
 	resp['deck'] = deck.get(params['deckid'])
 	resp['main'], resp['sideboard'] = deck.get_cards(params['deckid'])
 
-	if not os.path.exists(asynchro.card_art_filename(resp['deck']['cardid'])):
-		asynchro.get_card_art.delay(
+	resp['deck']['arturl'] = None
+	if resp['deck']['cardid']:
+		asynchro.request_card_art(
 			resp['deck']['cardid'],
 			resp['deck']['code'],
 			resp['deck']['collectornumber']
 		)
-	resp['deck']['arturl'] = serve_static_file(
-		f"images/card_art_{resp['deck']['cardid']}.jpg"
-	)
+		art_name = f"card_art_{resp['deck']['cardid']}.jpg"
+		resp['deck']['arturl'] = images.urls([art_name], 'full')[art_name]
 	del resp['deck']['cardid']
 	del resp['deck']['code']
 	del resp['deck']['collectornumber']
@@ -590,6 +644,7 @@ def decks_save() -> Response:
 			session['userid'],
 		)
 	)
+	cache.bump_user_version(session['userid'])
 	return jsonify()
 
 
@@ -601,6 +656,7 @@ def decks_delete() -> Response:
 		"UPDATE deck SET deleted = true WHERE id = %s AND userid = %s",
 		(params['deckid'], session['userid'],)
 	)
+	cache.bump_user_version(session['userid'])
 	return jsonify()
 
 
@@ -612,6 +668,7 @@ def decks_restore() -> Response:
 		"UPDATE deck SET deleted = false WHERE id = %s AND userid = %s",
 		(params['deckid'], session['userid'],)
 	)
+	cache.bump_user_version(session['userid'])
 	return jsonify()
 
 
@@ -623,6 +680,7 @@ def decks_set_cardart() -> Response:
 		"UPDATE deck SET cardartid = %s WHERE id = %s AND userid = %s",
 		(params['cardid'], params['deckid'], session['userid'],)
 	)
+	cache.bump_user_version(session['userid'])
 	return jsonify()
 
 
@@ -638,35 +696,21 @@ def decks_cards_delete() -> Response:
 		""",
 		(params['deck_cardid'], session['userid'],)
 	)
+	cache.bump_user_version(session['userid'])
 	return jsonify()
 
 
 @app.route('/decks/import/csv', methods=['POST'])
 @login_required
 def decks_import_csv() -> Response:
-	import csv
-
 	params = params_to_dict(request.form)
-	filename = '/tmp/upload_{}_{}.csv'.format(os.urandom(32), session['userid'])
-	try:
-		request.files['upload'].save(filename)
-	except FileNotFoundError:
-		return jsonify(error='Error uploading file. Please try again.')
-	rows = []
-	with open(filename) as csvfile:
-		importreader = csv.DictReader(csvfile)
-		for row in importreader:
-			rows.append(row)
-	os.remove(filename)
-
 	cards = []
-	for r in rows:
-		card = {
+	for r in functions.read_csv(request.files['upload'].stream):
+		cards.append({
 			'name': r['Name'],
 			'quantity': r['Count'],
-			'section': 'main' if row['Section'] == 'main' else 'sideboard'
-		}
-		cards.append(card)
+			'section': 'main' if r['Section'] == 'main' else 'sideboard'
+		})
 
 	deck.do_import(params['name'], cards)
 
@@ -726,5 +770,70 @@ def decks_import_arena() -> Response:
 	return jsonify()
 
 
+@app.cli.command('import-bulk')
+@click.argument('filename')
+@click.option('--chunk-size', default=1000, help='Cards to commit at a time.')
+@click.option('--restart', is_flag=True, help='Ignore any previous progress.')
+@click.option(
+	'--prewarm-images',
+	is_flag=True,
+	help='Queue image downloads for new printings.'
+)
+def import_bulk(
+	filename: str,
+	chunk_size: int,
+	restart: bool,
+	prewarm_images: bool
+) -> None:
+	"""Import a Scryfall bulk data file, e.g. default_cards."""
+	totals = collection.import_bulk_file(
+		filename,
+		chunk_size=chunk_size,
+		resume=not restart,
+		prewarm_images=prewarm_images
+	)
+	print('Inserted {} printings, skipped {}.'.format(
+		totals['inserted'],
+		totals['skipped']
+	))
+
+
+@app.cli.command('create-image-variants')
+def create_image_variants() -> None:
+	"""Create resized WebP variants for images downloaded before they existed."""
+	count = images.create_all_variants()
+	print('Created variants for {} images.'.format(count))
+
+
+@app.cli.command('shard-images')
+def shard_images() -> None:
+	"""Move images from the flat images directory into the sharded layout."""
+	count = images.migrate_flat()
+	print('Moved {} images.'.format(count))
+
+
+@app.cli.command('store-manasymbols')
+def store_manasymbols() -> None:
+	"""Parse mana symbols for cards imported before they were stored."""
+	count = deck.store_manasymbols()
+	print('Stored mana symbols for {} cards.'.format(count))
+
+
+@app.cli.command('resume-imports')
+def resume_unfinished_imports() -> None:
+	"""Queue collection imports which were never finished."""
+	imports = collection.resumable_imports()
+	for i in imports:
+		asynchro.run_import.delay(i['id'])
+	print('Queued {} imports.'.format(len(imports)))
+
+
+@app.cli.command('sync-catalog')
+@click.option('--all', 'refresh', is_flag=True, help='Resync every set.')
+def sync_catalog(refresh: bool) -> None:
+	"""Download TCGplayer product lists for sets with a group ID."""
+	catalog.sync(refresh=refresh)
+
+
 if __name__ == '__main__':
 	app.run()
@@ -1,14 +1,16 @@
 # Standard library imports
 import os
+from concurrent.futures import (
+	ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+)
 
 # Local imports
 from web import (
 	app, scryfall, tcgplayer, openexchangerates, collection,
-	config
+	config, catalog, cache, images
 )
-from flasktools import get_static_file, fetch_image
 from flasktools.celery import setup_celery
-from flasktools.db import mutate_query
+from flasktools.db import fetch_query, mutate_query
 import rollbar
 from celery.signals import task_failure
 
@@ -33,34 +35,90 @@ def handle_task_failure(**kwargs):
 
 
 def set_icon_filename(code: str) -> str:
-	return get_static_file('/images/set_icon_{}.svg'.format(code))
+	return images.path('set_icon_{}.svg'.format(code))
+
+
+def request_set_icons(codes: list) -> None:
+	"""Queue one task for the icons of all the given sets not yet pending."""
+	codes = [c for c in codes if images.index.claim(set_icon_filename(c))]
+	if codes:
+		get_set_icons.delay(codes)
 
 
 @celery.task(queue='collector')
-def get_set_icon(code: str) -> None:
-	filename = set_icon_filename(code)
-	if not os.path.exists(filename):
-		try:
-			url = scryfall.get_set(code)['icon_svg_uri']
-			fetch_image(filename, url)
-		except scryfall.NotFound:
-			pass
+def get_set_icons(codes: list) -> None:
+	downloaded = 0
+	for code in codes:
+		filename = set_icon_filename(code)
+		if not os.path.exists(filename):
+			try:
+				url = scryfall.get_set(code)['icon_svg_uri']
+				images.download(filename, url)
+			except scryfall.NotFound:
+				continue
+			except Exception as e:
+				print('Set icon download failed for {}: {}'.format(code, e))
+				continue
+			downloaded += 1
+		images.index.fetched(filename)
+	# Rebuild the set catalog's icon sprite once, with all the new icons
+	if downloaded:
+		cache.bump_set_version()
 
 
 def card_art_filename(cardid: int) -> str:
-	return get_static_file('/images/card_art_{}.jpg'.format(cardid))
+	return images.path('card_art_{}.jpg'.format(cardid))
+
+
+def request_card_art(cardid: int, code: str, collectornumber: str) -> None:
+	images.index.request(
+		card_art_filename(cardid),
+		get_card_art,
+		cardid, code, collectornumber
+	)
+
+
+def _image_urls(code: str, collectornumber: str) -> dict:
+	"""Image URLs for a printing, from import if stored or else Scryfall."""
+	urls = fetch_query(
+		"""
+		SELECT p.imageurl, p.arturl
+		FROM printing p
+		JOIN card_set cs ON (cs.id = p.card_setid)
+		WHERE cs.code = %s AND p.collectornumber = %s
+		AND p.imageurl IS NOT NULL
+		LIMIT 1
+		""",
+		(code, collectornumber,),
+		single_row=True
+	)
+	if not urls:
+		urls = scryfall.get(code, collectornumber)
+	return urls
 
 
 @celery.task(queue='collector')
 def get_card_art(cardid: int, code: str, collectornumber: str) -> None:
 	filename = card_art_filename(cardid)
 	if not os.path.exists(filename):
-		url = scryfall.get(code, collectornumber)['arturl']
-		fetch_image(filename, url)
+		url = _image_urls(code, collectornumber)['arturl']
+		images.download(filename, url)
+		images.create_variants(filename)
+	elif not images.has_variants(filename):
+		images.create_variants(filename)
+	images.index.fetched(filename)
 
 
 def card_image_filename(cardid: int) -> str:
-	return get_static_file('/images/card_image_{}.jpg'.format(cardid))
+	return images.path('card_image_{}.jpg'.format(cardid))
+
+
+def request_card_image(cardid: int, code: str, collectornumber: str) -> None:
+	images.index.request(
+		card_image_filename(cardid),
+		get_card_image,
+		cardid, code, collectornumber
+	)
 
 
 @celery.task(queue='collector')
@@ -68,35 +126,97 @@ def get_card_image(cardid: int, code: str, collectornumber: str) -> None:
 	filename = card_image_filename(cardid)
 	if not os.path.exists(filename):
 		try:
-			url = scryfall.get(code, collectornumber)['imageurl']
-			fetch_image(filename, url)
+			url = _image_urls(code, collectornumber)['imageurl']
+			images.download(filename, url)
 		except scryfall.NotFound:
-			pass
+			return
+		images.create_variants(filename)
+	elif not images.has_variants(filename):
+		images.create_variants(filename)
+	images.index.fetched(filename)
+
+
+@celery.task(queue='collector')
+def fetch_images(printingids: list) -> None:
+	"""
+	Download card images & art for many printings at once, straight from the
+	URLs stored at import.
+	"""
+	printings = fetch_query(
+		"""
+		SELECT id, imageurl, arturl FROM printing
+		WHERE id = ANY(%s) AND imageurl IS NOT NULL
+		""",
+		(printingids,)
+	)
+	downloads = []
+	for p in printings:
+		downloads.append((card_image_filename(p['id']), p['imageurl']))
+		if p['arturl'] is not None:
+			downloads.append((card_art_filename(p['id']), p['arturl']))
+	# Marked pending, so the same images aren't queued again meanwhile
+	downloads = [d for d in downloads if images.index.claim(d[0])]
+
+	def download(filename: str, url: str) -> None:
+		images.download(filename, url)
+		images.create_variants(filename, bump_version=False)
+		images.index.fetched(filename)
+
+	concurrency = getattr(config, 'IMAGE_CONCURRENCY', 8)
+	with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+		futures = {executor.submit(download, *d): d[0] for d in downloads}
+		for future in as_completed(futures):
+			# Reported one by one, so one bad image doesn't end the batch
+			try:
+				future.result()
+			except Exception as e:
+				print('Image download failed for {}: {}'.format(
+					os.path.basename(futures[future]),
+					e
+				))
+	# Once for the batch, rather than changing every ETag once per image
+	if downloads:
+		cache.bump_image_version()
+	print('Downloaded {} images.'.format(len(downloads)))
 
 
 @celery.task(queue='collector')
-def fetch_prices(cards: list, tcgplayer_token: str) -> None:
+def fetch_prices(cards: list, concurrency: int = None) -> None:
+	# Each request reads the current token from the shared cache, rather than
+	# one being handed in which could expire before or during the run
+	if concurrency is None:
+		concurrency = getattr(config, 'TCGPLAYER_CONCURRENCY', 4)
+	concurrency = max(concurrency, 1)
+
 	# Filter out cards without tcgplayerid to save requests
-	cards = [c for c in cards if c['productid'] is not None]
-	bulk_lots = ([cards[i:i + 250] for i in range(0, len(cards), 250)])
-	for lot in bulk_lots:
-		card_dict = {
-			str(c['id']): str(c['productid'])
-			for c in lot
-			if c['productid'] is not None
-		}
-		prices = tcgplayer.get_price(
-			card_dict,
-			token=tcgplayer_token
-		)
-		set_prices(prices)
+	priced = [c for c in cards if c['productid'] is not None]
+	bulk_lots = ([priced[i:i + 250] for i in range(0, len(priced), 250)])
+
+	# Keep several lots in flight at once, writing each lot's prices as soon as
+	# it arrives so database writes overlap with the outstanding requests.
+	# Writes stay on this thread, as it owns the database connection.
+	with ThreadPoolExecutor(max_workers=concurrency) as executor:
+		pending = set()
+		for lot in bulk_lots:
+			card_dict = {str(c['id']): str(c['productid']) for c in lot}
+			pending.add(
+				executor.submit(tcgplayer.get_price, card_dict)
+			)
+			if len(pending) >= concurrency:
+				done, pending = wait(pending, return_when=FIRST_COMPLETED)
+				for future in done:
+					set_prices(future.result())
+		for future in as_completed(pending):
+			set_prices(future.result())
 	print('Price update completed.')
 
-	# Try to match up cards without TCGPlayer IDs
-	for c in cards:
-		if c['productid'] is None:
+	# Try to match up cards without TCGPlayer IDs, from the set catalogs first
+	unmatched = [c for c in cards if c['productid'] is None]
+	resolved = catalog.resolve_products([c['id'] for c in unmatched])
+	for c in unmatched:
+		if c['id'] not in resolved:
 			print(f"Searching for TCGPlayer ID for {c['name']} ({c['set_name']}).")
-			c['productid'] = tcgplayer.search(c, token=tcgplayer_token)
+			c['productid'] = tcgplayer.search(c)
 			if c['productid'] is not None:
 				mutate_query(
 					"UPDATE printing SET tcgplayer_productid = %s WHERE id = %s",
@@ -128,6 +248,26 @@ def set_prices(prices):
 		updates,
 		executemany=True
 	)
+	cache.bump_global_version()
+
+
+@celery.task(queue='collector')
+def sync_catalog() -> None:
+	catalog.sync(refresh=True)
+	print('TCGplayer catalog sync completed.')
+
+
+@celery.task(queue='collector')
+def maintain_price_history() -> None:
+	rolled_up = mutate_query(
+		"SELECT maintain_price_history(%s::INTERVAL, %s::INTERVAL) AS rolled_up",
+		(
+			getattr(config, 'PRICE_HISTORY_DAILY_RETENTION', '6 months'),
+			getattr(config, 'PRICE_HISTORY_WEEKLY_RETENTION', '2 years'),
+		),
+		returning=True
+	)['rolled_up']
+	print('Rolled up {} months of price history.'.format(rolled_up))
 
 
 @celery.task(queue='collector')
@@ -140,10 +280,34 @@ def fetch_rates() -> None:
 		updates,
 		executemany=True
 	)
+	cache.bump_global_version()
 	print('Updated exchange rates')
 
 
+# Acknowledged only once run, so an import interrupted by a lost worker is
+# run again, resuming from its incomplete rows. Failed imports are retried
+# with a backoff, & ones whose task was lost are queued by resume_imports.
+@celery.task(
+	queue='collector',
+	acks_late=True,
+	reject_on_worker_lost=True,
+	autoretry_for=(Exception,),
+	retry_backoff=True,
+	max_retries=collection.IMPORT_ATTEMPTS - 1
+)
+def run_import(importid: int) -> None:
+	collection.run_import(importid)
+
+
+@celery.task(queue='collector')
+def resume_imports() -> None:
+	imports = collection.resumable_imports()
+	for i in imports:
+		run_import.delay(i['id'])
+	print('Queued {} imports.'.format(len(imports)))
+
+
 @celery.task(queue='collector')
 def refresh_from_scryfall(query: str) -> None:
 	resp = scryfall.search(query)
-	collection.import_cards(resp)
+	collection.import_cards(resp, prewarm_images=True)
@@ -0,0 +1,99 @@
+# Standard library imports
+import bisect
+import threading
+import time
+import unicodedata
+
+# Local imports
+from flasktools.db import fetch_query
+
+# Seconds between checks for cards added by other processes
+REFRESH_INTERVAL = 60
+
+
+def normalize(name: str) -> str:
+	"""Lower-case & strip accents, so prefixes match regardless of either."""
+	decomposed = unicodedata.normalize('NFKD', name)
+	return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+class NameIndex:
+	"""
+	Sorted array of normalized card names (and each face of multifaced names)
+	mapped to card IDs, held in memory by each worker for prefix lookups.
+	"""
+	def __init__(self) -> None:
+		self._keys = []
+		self._cards = []
+		self._cardids = set()
+		self._max_cardid = 0
+		self._loaded = False
+		self._checked = 0
+		self._lock = threading.Lock()
+
+	@staticmethod
+	def _entries(card: dict) -> list:
+		names = [card['name']]
+		if ' // ' in card['name']:
+			names += card['name'].split(' // ')
+		return [(normalize(n), card['name'], card['id']) for n in names]
+
+	def _load(self) -> None:
+		cards = fetch_query("SELECT id, name FROM card")
+		entries = sorted(e for c in cards for e in self._entries(c))
+		self._keys = [e[0] for e in entries]
+		self._cards = [{'id': e[2], 'name': e[1]} for e in entries]
+		self._cardids = {c['id'] for c in cards}
+		self._max_cardid = max(self._cardids, default=0)
+		self._loaded = True
+
+	def _insert(self, cards: list) -> None:
+		for c in cards:
+			if c['id'] in self._cardids:
+				continue
+			for key, name, cardid in self._entries(c):
+				i = bisect.bisect_right(self._keys, key)
+				self._keys.insert(i, key)
+				self._cards.insert(i, {'id': cardid, 'name': name})
+			self._cardids.add(c['id'])
+			self._max_cardid = max(self._max_cardid, c['id'])
+
+	def _refresh(self) -> None:
+		with self._lock:
+			if not self._loaded:
+				self._load()
+				self._checked = time.monotonic()
+			elif time.monotonic() - self._checked > REFRESH_INTERVAL:
+				self._insert(fetch_query(
+					"SELECT id, name FROM card WHERE id > %s",
+					(self._max_cardid,)
+				))
+				self._checked = time.monotonic()
+
+	def add(self, cards: list) -> None:
+		"""Add newly imported cards, if this worker has built its index."""
+		with self._lock:
+			if self._loaded:
+				self._insert(cards)
+
+	def lookup(self, prefix: str, limit: int = 10) -> list:
+		self._refresh()
+		key = normalize(prefix)
+		results = []
+		seen = set()
+		with self._lock:
+			i = bisect.bisect_left(self._keys, key)
+			while (
+				i < len(self._keys)
+				and self._keys[i].startswith(key)
+				and len(results) < limit
+			):
+				card = self._cards[i]
+				if card['id'] not in seen:
+					seen.add(card['id'])
+					results.append(card)
+				i += 1
+		return results
+
+
+index = NameIndex()
@@ -0,0 +1,73 @@
+# Standard library imports
+import hashlib
+
+# Third party imports
+import redis
+
+# Local imports
+from web import config
+
+_client = None
+
+
+def get_redis() -> redis.Redis:
+	"""Shared Redis connection, used for state shared across all workers."""
+	global _client
+	if _client is None:
+		_client = redis.Redis.from_url(
+			getattr(config, 'REDIS_URL', 'redis://localhost:6379/0')
+		)
+	return _client
+
+
+def key(*parts: any) -> str:
+	return ':'.join(['collector'] + [str(p) for p in parts])
+
+
+def versions(userid: int) -> tuple:
+	"""
+	Current data version for a user's collection & decks, along with the global
+	version covering data shared by everyone, such as prices & exchange rates.
+	"""
+	user_version, global_version = get_redis().mget(
+		key('version', 'user', userid),
+		key('version', 'global')
+	)
+	return int(user_version or 0), int(global_version or 0)
+
+
+def bump_user_version(userid: int) -> None:
+	get_redis().incr(key('version', 'user', userid))
+
+
+def bump_global_version() -> None:
+	get_redis().incr(key('version', 'global'))
+
+
+def set_version() -> int:
+	"""Version of the set catalog, bumped when sets or set icons are added."""
+	return int(get_redis().get(key('version', 'sets')) or 0)
+
+
+def bump_set_version() -> None:
+	get_redis().incr(key('version', 'sets'))
+
+
+def bump_image_version() -> None:
+	"""Bump when image URLs change, i.e. a smaller variant becomes available."""
+	get_redis().incr(key('version', 'images'))
+
+
+def etag(userid: int, *parts: any) -> str:
+	"""
+	Strong ETag for a response built from a user's data, which changes whenever
+	the user's or the global data version is bumped, or image URLs change.
+	"""
+	versions = get_redis().mget(
+		key('version', 'user', userid),
+		key('version', 'global'),
+		key('version', 'images')
+	)
+	parts = (userid,) + tuple(int(v or 0) for v in versions) + parts
+	value = ':'.join(str(p) for p in parts)
+	return hashlib.sha1(value.encode()).hexdigest()
@@ -0,0 +1,169 @@
+# Standard library imports
+import hashlib
+import json
+import os
+import threading
+import time
+from xml.etree import ElementTree
+
+# Local imports
+from web import cache, images
+from flasktools.db import fetch_query
+
+SVG_NAMESPACE = 'http://www.w3.org/2000/svg'
+
+# Size of each icon's cell in the sprite, which icons are scaled to fit
+SPRITE_CELL = 100
+
+# Seconds the catalog may be cached by browsers
+MAX_AGE = 60 * 5
+
+# Seconds a superseded sprite is kept, so catalogs cached by browsers or still
+# served by other workers don't point at a missing file
+SPRITE_RETENTION = 60 * 60
+
+ElementTree.register_namespace('', SVG_NAMESPACE)
+ElementTree.register_namespace('xlink', 'http://www.w3.org/1999/xlink')
+
+
+def icon_name(code: str) -> str:
+	return 'set_icon_{}.svg'.format(code)
+
+
+def _view_id(code: str) -> str:
+	return 'set-{}'.format(code.lower())
+
+
+def _svg(tag: str) -> str:
+	return '{{{}}}{}'.format(SVG_NAMESPACE, tag)
+
+
+def remove_old_sprites(current: str, previous: str = None) -> int:
+	"""
+	Schedule the previous sprite for removal, then remove any superseded for
+	longer than SPRITE_RETENTION. Returns the number removed.
+	"""
+	r = cache.get_redis()
+	superseded = cache.key('sprites', 'superseded')
+	now = time.time()
+	if current is not None:
+		r.zrem(superseded, current)
+	if previous is not None and previous != current:
+		r.zadd(superseded, {previous: now}, nx=True)
+
+	expired = r.zrangebyscore(superseded, '-inf', now - SPRITE_RETENTION)
+	for name in (n.decode() for n in expired):
+		try:
+			os.remove(images.path(name))
+		except FileNotFoundError:
+			pass
+		r.zrem(superseded, name)
+	return len(expired)
+
+
+def build_sprite(codes: list) -> tuple:
+	"""
+	Combine the downloaded icons of the given sets into one SVG, with a view of
+	each icon so it can be shown on its own as `<sprite url>#set-<code>`.
+	Returns the sprite's image name, which includes a hash of its content, and
+	the codes of the sets whose icons it contains.
+	"""
+	sprite = ElementTree.Element(_svg('svg'))
+	included = []
+	for code in codes:
+		try:
+			icon = ElementTree.parse(images.path(icon_name(code))).getroot()
+		except (OSError, ElementTree.ParseError):
+			continue
+		y = len(included) * SPRITE_CELL
+		ElementTree.SubElement(sprite, _svg('view'), {
+			'id': _view_id(code),
+			'viewBox': '0 {} {} {}'.format(y, SPRITE_CELL, SPRITE_CELL)
+		})
+		cell = ElementTree.SubElement(sprite, _svg('svg'), {
+			'x': '0',
+			'y': str(y),
+			'width': str(SPRITE_CELL),
+			'height': str(SPRITE_CELL)
+		})
+		viewbox = icon.get('viewBox')
+		if viewbox is None and icon.get('width') and icon.get('height'):
+			viewbox = '0 0 {} {}'.format(icon.get('width'), icon.get('height'))
+		if viewbox is not None:
+			cell.set('viewBox', viewbox)
+		cell.extend(list(icon))
+		included.append(code)
+
+	sprite.set('viewBox', '0 0 {} {}'.format(
+		SPRITE_CELL,
+		SPRITE_CELL * len(included)
+	))
+	content = ElementTree.tostring(sprite)
+	digest = hashlib.sha1(content).hexdigest()[:12]
+	name = 'set_icons.{}.sprite.svg'.format(digest)
+	filename = images.path(name)
+	if not os.path.exists(filename):
+		images.make_dir(filename)
+		tmp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+		with open(tmp_filename, 'wb') as f:
+			f.write(content)
+		os.replace(tmp_filename, filename)
+	return name, included
+
+
+class SetCatalog:
+	"""
+	Every set with its icon URL, serialized once per worker and rebuilt only
+	when the set version is bumped (a set is imported or an icon is fetched).
+	"""
+	def __init__(self) -> None:
+		self._version = None
+		self._body = None
+		self._etag = None
+		self._sprite_name = None
+		self._lock = threading.Lock()
+
+	def _build(self) -> None:
+		# Imported here, as the tasks import the collection & so this module
+		from web import asynchro
+
+		sets = fetch_query(
+			"SELECT id, name, code FROM card_set ORDER BY released DESC"
+		)
+		downloaded = []
+		missing = []
+		for s in sets:
+			if os.path.exists(images.path(icon_name(s['code']))):
+				downloaded.append(s['code'])
+			else:
+				missing.append(s['code'])
+		if missing:
+			asynchro.request_set_icons(missing)
+
+		icon_urls = {}
+		sprite_name = None
+		if downloaded:
+			sprite_name, included = build_sprite(downloaded)
+			sprite_url = images.url(sprite_name)
+			for code in included:
+				icon_urls[code] = '{}#{}'.format(sprite_url, _view_id(code))
+
+		remove_old_sprites(sprite_name, previous=self._sprite_name)
+		self._sprite_name = sprite_name
+		for s in sets:
+			s['iconurl'] = icon_urls.get(s['code'])
+
+		self._body = json.dumps({'sets': sets})
+		self._etag = hashlib.sha1(self._body.encode()).hexdigest()
+
+	def get(self) -> tuple:
+		"""The serialized catalog & its ETag."""
+		version = cache.set_version()
+		with self._lock:
+			if self._version != version:
+				self._build()
+				self._version = version
+			return self._body, self._etag
+
+
+catalog = SetCatalog()
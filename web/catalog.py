@@ -0,0 +1,121 @@
+# Standard library imports
+import json
+
+# Local imports
+from web import tcgplayer
+from flasktools.db import fetch_query, mutate_query
+
+
+def sync_group(groupid: int, token: str = None) -> int:
+	"""Store a snapshot of a TCGplayer group's product list."""
+	products = tcgplayer.get_group_products(groupid, token=token)
+	mutate_query(
+		"""
+		INSERT INTO tcgplayer_product (
+			productid, groupid, name, collectornumber, rarity, languages
+		) SELECT
+			x.productid, x.groupid, x.name, x.collectornumber, x.rarity, x.languages
+		FROM jsonb_to_recordset(%s::JSONB) AS x(
+			productid INTEGER, groupid INTEGER, name TEXT, collectornumber TEXT,
+			rarity TEXT, languages TEXT[]
+		)
+		ON CONFLICT (productid) DO UPDATE SET
+			groupid = EXCLUDED.groupid,
+			name = EXCLUDED.name,
+			collectornumber = EXCLUDED.collectornumber,
+			rarity = EXCLUDED.rarity,
+			languages = EXCLUDED.languages
+		""",
+		(json.dumps(products),)
+	)
+	mutate_query(
+		"UPDATE card_set SET tcgplayer_synced = now() WHERE tcgplayer_groupid = %s",
+		(groupid,)
+	)
+	print('Synced {} TCGplayer products for group {}.'.format(
+		len(products),
+		groupid
+	))
+	return len(products)
+
+
+def sync(
+	printingids: list = None,
+	refresh: bool = False,
+	token: str = None
+) -> None:
+	"""
+	Sync the catalog of each set with a TCGplayer group. Unless refreshing, only
+	sets which have never been synced are fetched. Can be limited to the sets
+	of the given printings.
+	"""
+	qry = """SELECT DISTINCT cs.tcgplayer_groupid AS groupid
+			FROM card_set cs
+			WHERE cs.tcgplayer_groupid IS NOT NULL"""
+	qargs = ()
+	if not refresh:
+		qry += " AND cs.tcgplayer_synced IS NULL"
+	if printingids is not None:
+		qry += """ AND EXISTS (
+				SELECT 1 FROM printing p
+				WHERE p.card_setid = cs.id AND p.id = ANY(%s)
+			)"""
+		qargs += (printingids,)
+	groups = fetch_query(qry, qargs)
+	if groups and token is None:
+		token = tcgplayer.get_token()
+	for g in groups:
+		sync_group(g['groupid'], token=token)
+
+
+def resolve_products(printingids: list, token: str = None) -> dict:
+	"""
+	Match printings without a TCGplayer product ID against the stored catalog by
+	set, name & collector number, syncing the catalog of any new sets first.
+	Only unambiguous matches are used.
+
+	Returns a dict of printing ID to the product ID found for it.
+	"""
+	if not printingids:
+		return {}
+	sync(printingids=printingids, token=token)
+
+	resolved = mutate_query(
+		"""
+		WITH matched AS (
+			SELECT p.id, MIN(tp.productid) AS productid
+			FROM printing p
+			JOIN card c ON (c.id = p.cardid)
+			JOIN card_set cs ON (cs.id = p.card_setid)
+			JOIN tcgplayer_product tp ON (
+				tp.groupid = cs.tcgplayer_groupid
+				-- TCGplayer only uses the front face name of multifaced cards
+				AND name_key(tp.name) = name_key(split_part(c.name, ' // ', 1))
+				AND ltrim(tp.collectornumber, '0') = ltrim(p.collectornumber, '0')
+				AND (tp.languages IS NULL OR 'English' = ANY(tp.languages))
+			)
+			WHERE p.id = ANY(%s)
+			AND p.tcgplayer_productid IS NULL
+			AND p.language = 'en'
+			AND NOT is_basic_land(c.id)
+			GROUP BY p.id
+			HAVING COUNT(1) = 1
+		), updated AS (
+			UPDATE printing SET tcgplayer_productid = m.productid::TEXT
+			FROM matched m
+			WHERE printing.id = m.id
+			RETURNING printing.id, printing.tcgplayer_productid
+		) SELECT COALESCE(
+			json_object_agg(id, tcgplayer_productid),
+			'{}'
+		) AS products
+		FROM updated
+		""",
+		(printingids,),
+		returning=True
+	)['products']
+	print('Resolved {} of {} TCGplayer IDs from the catalog.'.format(
+		len(resolved),
+		len(printingids)
+	))
+	return {int(k): v for k, v in resolved.items()}
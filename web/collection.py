@@ -1,12 +1,39 @@
+# Standard library imports
+import hashlib
+import json
+import os
+
 # Third party imports
 from flask import session
 
 # Local imports
-from web import scryfall, tcgplayer, functions
-from flasktools import strip_unicode_characters, serve_static_file
+from web import (
+	autocomplete, cache, catalog, deck, images, scryfall, search, tcgplayer,
+	functions
+)
+from flasktools import strip_unicode_characters
 from flasktools.db import fetch_query, mutate_query
 
 
+# Price of a user's card before conversion to their currency, for use in
+# queries over user_card uc & printing p
+BASE_PRICE = "(CASE WHEN uc.foil THEN p.foilprice ELSE p.price END)"
+
+# Import rows added to the collection at a time, each chunk being committed
+IMPORT_CHUNK_SIZE = 500
+
+# Times a failed import is run before it's left as failed
+IMPORT_ATTEMPTS = 3
+
+# Time without progress after which an unfinished import's task is taken to
+# be lost
+IMPORT_STALLED = '1 hour'
+
+# Seconds to keep cached collection totals, which are also replaced whenever
+# the collection or prices change
+AGGREGATE_EXPIRY = 60 * 60 * 24
+
+
 def get(params: dict) -> dict:
 	resp = {}
 
@@ -16,44 +43,30 @@ def get(params: dict) -> dict:
 		page = int(params.get('page'))
 	offset = page * limit - limit
 
-	# Sorting
+	# Sorting, along with the type of each sort column for use in cursors.
+	# Sort columns are never NULL so rows can be sought by cursor.
 	cols = {
-		'name': 'c.name',
-		'setname': 'cs.released',
-		'rarity': "get_rarity_sort(p.rarity)",
-		'quantity': 'uc.quantity',
-		'foil': 'uc.foil',
-		'price': 'get_price(uc.id)'
+		'name': ('c.name', 'TEXT'),
+		'setname': ('cs.released', 'DATE'),
+		'rarity': ('COALESCE(get_rarity_sort(p.rarity), 0)', 'INTEGER'),
+		'quantity': ('uc.quantity', 'INTEGER'),
+		'foil': ('uc.foil', 'BOOLEAN'),
+		# Exchange rate is the same for every row, so no need to convert
+		'price': ('COALESCE({}::NUMERIC, 0)'.format(BASE_PRICE), 'NUMERIC')
 	}
-	sort = cols.get(params.get('sort'), 'c.name')
+	sort_key = params.get('sort') if params.get('sort') in cols else 'name'
+	sort, sort_type = cols[sort_key]
 	descs = {'asc': 'ASC', 'desc': 'DESC'}
 	sort_desc = descs.get(params.get('sort_desc'), 'ASC')
 
 	# Filters
-	search = f"%{params['filter_search']}%" if params['filter_search'] else None
 	filters = {
-		'search': search,
+		'search': params.get('filter_search') or None,
 		'set': params.get('filter_set'),
 		'rarity': params.get('filter_rarity')
 	}
 
-	qry = """SELECT count(1) AS count,
-				sum(uc.quantity) AS sum,
-				sum(uc.quantity * get_price(uc.id)) AS sumprice
-			FROM user_card uc
-			LEFT JOIN printing p ON (p.id = uc.printingid)
-			WHERE uc.userid = %s"""
-	qargs = (session['userid'],)
-	if filters['search']:
-		qry += " AND (SELECT name FROM card WHERE id = p.cardid) ILIKE %s"
-		qargs += (filters['search'],)
-	if filters['set']:
-		qry += " AND p.card_setid = %s"
-		qargs += (filters['set'],)
-	if filters['rarity']:
-		qry += " AND p.rarity = %s"
-		qargs += (filters['rarity'],)
-	aggregate = fetch_query(qry, qargs, single_row=True)
+	aggregate = _get_aggregate(filters)
 	resp['count'] = functions.pagecount(aggregate['count'], limit)
 	resp['total'] = aggregate['sum']
 	resp['totalprice'] = aggregate['sumprice']
@@ -61,24 +74,24 @@ def get(params: dict) -> dict:
 	qry = """SELECT
 				p.id, uc.id AS user_cardid, c.name, cs.name AS setname, cs.code AS setcode,
 				get_rarity(p.rarity) AS rarity, uc.quantity, uc.foil,
-				get_price(uc.id) AS price,
-				get_base_price(uc.id) AS base_price,
-				COALESCE(
-					(SELECT currencycode FROM app.enduser WHERE id = uc.userid),
-					'USD'
-				) AS currencycode,
+				{base_price} * r.exchangerate AS price,
+				{base_price} AS base_price,
+				r.currencycode,
 				p.collectornumber, p.card_setid,
-				CASE WHEN p.language != 'en' THEN UPPER(p.language) END AS language
+				CASE WHEN p.language != 'en' THEN UPPER(p.language) END AS language,
+				{sort} AS sort_value
 			FROM user_card uc
 			LEFT JOIN printing p ON (uc.printingid = p.id)
 			LEFT JOIN card c ON (p.cardid = c.id)
 			LEFT JOIN card_set cs ON (p.card_setid = cs.id)
-			WHERE uc.userid = %s"""
-	qargs = (session['userid'],)
+			CROSS JOIN user_currency(%s) r
+			WHERE uc.userid = %s""".format(base_price=BASE_PRICE, sort=sort)
+	qargs = (session['userid'], session['userid'],)
 
 	if filters['search']:
-		qry += " AND c.name ILIKE %s"
-		qargs += ('%' + filters['search'] + '%',)
+		search_qry, search_args = search.name_filter(filters['search'])
+		qry += " AND " + search_qry
+		qargs += search_args
 	if filters['set']:
 		qry += " AND p.card_setid = %s"
 		qargs += (filters['set'],)
@@ -86,29 +99,117 @@ def get(params: dict) -> dict:
 		qry += " AND p.rarity = %s"
 		qargs += (filters['rarity'],)
 
+	# Seek straight to the row after the cursor, if it was created for the
+	# current sort. Otherwise fall back to paging by offset.
+	cursor = None
+	if params.get('cursor'):
+		cursor = functions.decode_cursor(params['cursor'])
+	if (
+		isinstance(cursor, dict)
+		and cursor.get('sort') == sort_key
+		and cursor.get('sort_desc') == sort_desc
+		and len(cursor.get('after') or []) == 4
+	):
+		qry += """ AND (
+				{sort} {op} %s::{sort_type}
+				OR (
+					{sort} = %s::{sort_type}
+					AND (cs.code, p.collectornumber, uc.id) > (%s, %s, %s)
+				)
+			)""".format(
+			sort=sort,
+			op='<' if sort_desc == 'DESC' else '>',
+			sort_type=sort_type
+		)
+		after = cursor['after']
+		qargs += (after[0], after[0], after[1], after[2], after[3],)
+		offset = 0
+
 	qry += """ ORDER BY
 				%s %s,
 				cs.code,
-				p.collectornumber
+				p.collectornumber,
+				uc.id
 			LIMIT
 				%%s
 			OFFSET %%s
 			""" % (sort, sort_desc)
 	qargs += (limit, offset,)
 	resp['cards'] = fetch_query(qry, qargs)
+
+	resp['next_cursor'] = None
+	if len(resp['cards']) == limit:
+		last = resp['cards'][-1]
+		resp['next_cursor'] = functions.encode_cursor({
+			'sort': sort_key,
+			'sort_desc': sort_desc,
+			'after': [
+				last['sort_value'],
+				last['setcode'],
+				last['collectornumber'],
+				last['user_cardid']
+			]
+		})
+
+	image_names = ['card_image_{}.jpg'.format(c['id']) for c in resp['cards']]
+	art_names = ['card_art_{}.jpg'.format(c['id']) for c in resp['cards']]
+	image_urls = images.urls(image_names, 'full')
+	thumb_urls = images.urls(image_names, 'small')
+	art_urls = images.urls(art_names, 'small')
 	for c in resp['cards']:
-		c['imageurl'] = serve_static_file('images/card_image_{}.jpg'.format(c['id']))
-		c['arturl'] = serve_static_file('images/card_art_{}.jpg'.format(c['id']))
+		c['imageurl'] = image_urls['card_image_{}.jpg'.format(c['id'])]
+		c['thumburl'] = thumb_urls['card_image_{}.jpg'.format(c['id'])]
+		c['arturl'] = art_urls['card_art_{}.jpg'.format(c['id'])]
 
 		if c['currencycode'] == 'USD':
 			c['base_price'] = None
 
 		# Remove keys unnecessary in response
 		del c['card_setid']
+		del c['sort_value']
 
 	return resp
 
 
+def _get_aggregate(filters: dict) -> dict:
+	"""
+	Count & totals for the user's collection with the given filters, cached
+	until the user's collection or prices change.
+	"""
+	user_version, global_version = cache.versions(session['userid'])
+	cache_key = cache.key(
+		'collection', 'aggregate', session['userid'], user_version, global_version,
+		hashlib.sha1(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+	)
+	cached = cache.get_redis().get(cache_key)
+	if cached is not None:
+		return json.loads(cached)
+
+	qry = """SELECT count(1) AS count,
+				sum(uc.quantity) AS sum,
+				sum(uc.quantity * %s * r.exchangerate) AS sumprice
+			FROM user_card uc
+			LEFT JOIN printing p ON (p.id = uc.printingid)
+			LEFT JOIN card c ON (c.id = p.cardid)
+			CROSS JOIN user_currency(%%s) r
+			WHERE uc.userid = %%s""" % BASE_PRICE
+	qargs = (session['userid'], session['userid'],)
+	if filters['search']:
+		search_qry, search_args = search.name_filter(filters['search'])
+		qry += " AND " + search_qry
+		qargs += search_args
+	if filters['set']:
+		qry += " AND p.card_setid = %s"
+		qargs += (filters['set'],)
+	if filters['rarity']:
+		qry += " AND p.rarity = %s"
+		qargs += (filters['rarity'],)
+	aggregate = fetch_query(qry, qargs, single_row=True)
+
+	cache.get_redis().set(cache_key, json.dumps(aggregate), ex=AGGREGATE_EXPIRY)
+	return aggregate
+
+
 def add(printingid: int, foil: bool, quantity: int) -> None:
 	existing = fetch_query(
 		"""
@@ -143,6 +244,7 @@ def add(printingid: int, foil: bool, quantity: int) -> None:
 				session['userid'],
 			)
 		)
+	cache.bump_user_version(session['userid'])
 
 
 def remove(printingid: int, foil: bool, quantity: int) -> None:
@@ -166,125 +268,251 @@ def remove(printingid: int, foil: bool, quantity: int) -> None:
 			qry = "UPDATE user_card SET quantity = quantity - %s WHERE id = %s"
 			qargs = (quantity, existing['id'],)
 		mutate_query(qry, qargs)
+		cache.bump_user_version(session['userid'])
 	else:
 		raise Exception('Could not find card {}.'.format(printingid))
 
 
-def import_cards(cards: list) -> None:
-	sets = []
-	for c in cards:
-		if c['set'] not in [x['code'] for x in sets]:
-			sets.append({'code': c['set'], 'name': c['set_name']})
-
-	for s in sets:
-		# Check if already have a record of this set
-		existing = fetch_query(
-			"SELECT 1 FROM card_set WHERE LOWER(code) = LOWER(%s)",
-			(s['code'],)
+def read_csv(stream: any) -> list:
+	"""Rows of a collection CSV export, read straight from an upload stream."""
+	rows = []
+	for row in functions.read_csv(stream):
+		rows.append({
+			'scryfallid': row['Scryfall ID'],
+			'foil': int(row['Foil quantity']) > 0,
+			'quantity': int(row['Quantity'])
+		})
+	return rows
+
+
+def missing_printings(scryfall_ids: list) -> list:
+	"""The given Scryfall IDs which haven't been imported yet."""
+	existing = fetch_query(
+		"SELECT scryfallid FROM printing WHERE scryfallid = ANY(%s::TEXT[])",
+		(list(set(scryfall_ids)),)
+	)
+	existing_ids = {p['scryfallid'] for p in existing}
+	return [i for i in dict.fromkeys(scryfall_ids) if i not in existing_ids]
+
+
+def stage_import(stream: any, filename: str) -> int:
+	"""Record the rows of an uploaded collection CSV, to be imported by a task."""
+	rows = read_csv(stream)
+
+	importid = mutate_query(
+		"""
+		INSERT INTO import (filename, userid, status)
+		VALUES (%s, %s, 'pending')
+		RETURNING id
+		""",
+		(filename, session['userid'],),
+		returning=True
+	)['id']
+
+	mutate_query(
+		"""
+		INSERT INTO import_row (
+			importid, scryfallid, foil, quantity
+		) SELECT
+			%s, x.scryfallid, x.foil, x.quantity
+		FROM jsonb_to_recordset(%s::JSONB) AS x(
+			scryfallid TEXT, foil BOOLEAN, quantity INTEGER
+		)
+		""",
+		(importid, json.dumps(rows),)
+	)
+	return importid
+
+
+def run_import(importid: int) -> None:
+	"""
+	Import any printings not yet known, then add the rows of an import to the
+	user's collection a chunk at a time. Only incomplete rows are imported, so
+	an interrupted import resumes where it stopped when run again. Rows whose
+	printing Scryfall doesn't know are left incomplete & the import is marked
+	partial. An import which fails is marked as retrying until its last
+	attempt, when it's marked as failed.
+	"""
+	started = mutate_query(
+		"""
+		UPDATE import
+		SET status = 'running', attempts = attempts + 1, updated = now()
+		WHERE id = %s
+		AND status IN ('pending', 'running', 'retrying')
+		RETURNING userid, attempts
+		""",
+		(importid,),
+		returning=True
+	)
+	# Already finished, e.g. by another run of the same import
+	if started is None:
+		return
+	userid = started['userid']
+	try:
+		pending = fetch_query(
+			"""
+			SELECT DISTINCT scryfallid FROM import_row
+			WHERE importid = %s
+			AND printingid IS NULL
+			AND NOT complete
+			""",
+			(importid,)
 		)
-		if not existing:
-			resp = scryfall.get_set(s['code'])
+		new = missing_printings([r['scryfallid'] for r in pending])
+		for lot in functions.chunks(new, 75):
+			import_cards(scryfall.get_bulk(lot, skip_missing=True))
+
+		mutate_query(
+			"""
+			UPDATE import_row ir
+			SET printingid = p.id
+			FROM printing p
+			WHERE p.scryfallid = ir.scryfallid
+			AND ir.importid = %s
+			AND ir.printingid IS NULL
+			""",
+			(importid,)
+		)
+
+		while complete_import(importid, limit=IMPORT_CHUNK_SIZE):
+			cache.bump_user_version(userid)
 			mutate_query(
-				"""
-				INSERT INTO card_set (
-					name, code, released, tcgplayer_groupid
-				) SELECT
-					%s, %s, %s, %s
-				WHERE NOT EXISTS (SELECT * FROM card_set WHERE code = %s)
-				""",
-				(
-					resp['name'],
-					s['code'],
-					resp['released_at'],
-					resp.get('tcgplayer_id'),
-					s['code'],
-				)
+				"UPDATE import SET updated = now() WHERE id = %s",
+				(importid,)
+			)
+
+		unresolved = fetch_query(
+			"""
+			SELECT COUNT(*) AS count FROM import_row
+			WHERE importid = %s
+			AND NOT complete
+			""",
+			(importid,),
+			single_row=True
+		)['count']
+	except Exception:
+		mutate_query(
+			"UPDATE import SET status = %s, updated = now() WHERE id = %s",
+			(
+				'failed' if started['attempts'] >= IMPORT_ATTEMPTS
+				else 'retrying',
+				importid,
 			)
+		)
+		raise
+
+	mutate_query(
+		"UPDATE import SET status = %s, updated = now() WHERE id = %s",
+		('partial' if unresolved else 'complete', importid,)
+	)
+
+
+def complete_import(importid: int, limit: int = None) -> int:
+	"""
+	Add incomplete rows of an import to the user's collection, up to `limit` at
+	once, returning how many were added.
+	"""
+	return mutate_query(
+		"""
+		WITH completed AS (
+			UPDATE import_row ir
+			SET complete = true
+			FROM import i
+			WHERE i.id = ir.importid
+			AND NOT ir.complete
+			AND ir.id IN (
+				SELECT id FROM import_row
+				WHERE importid = %s
+				AND NOT complete
+				AND printingid IS NOT NULL
+				ORDER BY id
+				LIMIT %s
+			)
+			RETURNING i.userid, ir.printingid, ir.foil, ir.quantity
+		), added AS (
+			INSERT INTO user_card (
+				userid, printingid, foil, quantity
+			) SELECT
+				userid, printingid, foil, SUM(quantity)
+			FROM completed
+			GROUP BY userid, printingid, foil
+			ON CONFLICT (userid, printingid, foil) DO UPDATE
+			SET quantity = user_card.quantity + EXCLUDED.quantity
+		)
+		SELECT COUNT(*) AS count FROM completed
+		""",
+		(importid, limit,),
+		returning=True
+	)['count']
+
 
-	# more efficient than attempting inserts
-	resp = fetch_query(
-		"SELECT DISTINCT scryfallid FROM printing WHERE scryfallid IS NOT NULL"
+def resumable_imports() -> list:
+	"""
+	Imports which were never finished & have made no progress for
+	IMPORT_STALLED, so their task was lost rather than still queued, running
+	or waiting to retry.
+	"""
+	return fetch_query(
+		"""
+		SELECT id FROM import
+		WHERE status IN ('pending', 'running', 'retrying')
+		AND updated < now() - %s::INTERVAL
+		ORDER BY id
+		""",
+		(IMPORT_STALLED,)
+	)
+
+
+def import_status(importid: int) -> dict:
+	return fetch_query(
+		"""
+		SELECT
+			i.status,
+			COUNT(ir.id) AS total,
+			COUNT(ir.id) FILTER (WHERE ir.complete) AS complete,
+			COUNT(ir.id) FILTER (
+				WHERE NOT ir.complete AND ir.printingid IS NULL
+			) AS unresolved
+		FROM import i
+		LEFT JOIN import_row ir ON (ir.importid = i.id)
+		WHERE i.id = %s
+		AND i.userid = %s
+		GROUP BY i.id
+		""",
+		(importid, session['userid'],),
+		single_row=True
 	)
-	scryfall_ids = [x['scryfallid'] for x in resp]
+
+
+def import_cards(cards: list, prewarm_images: bool = False) -> dict:
+	result = bulk_import_cards(cards, prewarm_images=prewarm_images)
+
+	# Resolve as many TCGplayer IDs as possible from the synced set catalogs,
+	# only searching for the rest one by one
+	resolved = catalog.resolve_products([c['id'] for c in result['printings']])
 
 	new_cards = []
-	for c in cards:
-		if c['scryfallid'] in scryfall_ids:
-			print('Existing {}...'.format(c['scryfallid']))
+	for c in result['printings']:
+		if c['id'] in resolved:
+			new_cards.append({'id': c['id'], 'productid': resolved[c['id']]})
 			continue
 
-		existing = fetch_query(
-			"SELECT id FROM card WHERE LOWER(name) = LOWER(%s)",
-			(c['name'],),
-			single_row=True
-		)
-		if existing:
-			cardid = existing['id']
-		else:
-			print('Inserting card {}'.format(c['name']))
-			new = mutate_query(
+		c['set_code'] = c['set']  # Key needed for searching on tcgplayer
+		c['productid'] = tcgplayer.search(c)
+		if c['productid'] is not None:
+			mutate_query(
 				"""
-				INSERT INTO card (
-					name, colors, multifaced, cmc, typeline, manacost
-				) SELECT
-					%s, %s, %s, %s, %s, %s
-				WHERE NOT EXISTS (
-					SELECT 1 FROM card WHERE LOWER(name) = LOWER(%s)
-				) RETURNING id
+				UPDATE
+					printing
+				SET
+					tcgplayer_productid = %s
+				WHERE
+					id = %s AND
+					NOT is_basic_land(cardid)
 				""",
-				(
-					c['name'], c['colors'], c['multifaced'], c['cmc'],
-					strip_unicode_characters(c['typeline']), c['manacost'],
-					c['name'],
-				),
-				returning=True
+				(c['productid'], c['id'],)
 			)
-			cardid = new['id']
-
-		new = mutate_query(
-			"""
-			INSERT INTO printing (
-				cardid, collectornumber, multiverseid, scryfallid,
-				card_setid,
-				rarity, language
-			) SELECT
-				%s, %s, %s, %s,
-				(SELECT id FROM card_set WHERE code = %s),
-				%s, %s
-			WHERE NOT EXISTS (
-				SELECT 1 FROM printing
-				WHERE cardid = %s
-				AND collectornumber = %s
-				AND card_setid = (SELECT id FROM card_set WHERE code = %s)
-			) RETURNING id
-			""",
-			(
-				cardid, c['collectornumber'], c['multiverseid'], c['scryfallid'],
-				c['set'],
-				c['rarity'], c['language'],
-				cardid, c['collectornumber'], c['set'],
-			),
-			returning=True
-		)
-		if new:
-			print('Inserted printing {}'.format(c['name']))
-			c['id'] = new['id']
-			c['set_code'] = c['set']  # Key needed for searching on tcgplayer
-			c['productid'] = tcgplayer.search(c)
-			if c['productid'] is not None:
-				mutate_query(
-					"""
-					UPDATE
-						printing
-					SET
-						tcgplayer_productid = %s
-					WHERE
-						id = %s AND
-						NOT is_basic_land(cardid)
-					""",
-					(c['productid'], c['id'],)
-				)
-				new_cards.append({'id': c['id'], 'productid': c['productid']})
+			new_cards.append({'id': c['id'], 'productid': c['productid']})
 
 	bulk_lots = ([new_cards[i:i + 250] for i in range(0, len(new_cards), 250)])
 	prices = {}
@@ -317,3 +545,255 @@ def import_cards(cards: list) -> None:
 		updates,
 		executemany=True
 	)
+	if updates:
+		cache.bump_global_version()
+
+	return result
+
+
+def bulk_import_cards(cards: list, prewarm_images: bool = False) -> dict:
+	"""
+	Insert any new sets, cards & printings from a list of simplified Scryfall
+	cards using a fixed number of set-based statements, regardless of how many
+	cards are passed in. Images for the new printings can be fetched straight
+	away with `prewarm_images`.
+
+	Returns the inserted & skipped printing counts, along with the cards which
+	resulted in a new printing (with the printing ID added as `id`, and the
+	card ID as `cardid`).
+	"""
+	_import_sets(cards)
+
+	rows = []
+	for c in cards:
+		row = dict(c)
+		row['typeline'] = strip_unicode_characters(c['typeline'])
+		row['manasymbols'] = deck.parse_manacost(c['manacost'])
+		rows.append(row)
+	data = json.dumps(rows)
+
+	# Cards are matched on their name key (see card_name in schema.pgsql)
+	mutate_query(
+		"""
+		INSERT INTO card (
+			name, colors, multifaced, cmc, typeline, manacost, manasymbols,
+			basic_land
+		) SELECT DISTINCT ON (name_key(x.name))
+			x.name, x.colors, x.multifaced, x.cmc, x.typeline, x.manacost,
+			x.manasymbols, COALESCE(x.typeline ILIKE '%%basic%%land%%', false)
+		FROM jsonb_to_recordset(%s::JSONB) AS x(
+			name TEXT, colors TEXT, multifaced BOOLEAN, cmc NUMERIC,
+			typeline TEXT, manacost TEXT, manasymbols TEXT[], scryfallid TEXT
+		)
+		WHERE NOT EXISTS (
+			SELECT 1 FROM printing WHERE scryfallid = x.scryfallid
+		)
+		AND NOT EXISTS (
+			SELECT 1 FROM card_name
+			WHERE name_key = name_key(x.name)
+			AND NOT face
+		)
+		ORDER BY name_key(x.name)
+		""",
+		(data,)
+	)
+
+	# Printings are skipped if the Scryfall ID, or the same card & collector
+	# number in the set, already exists
+	new = mutate_query(
+		"""
+		WITH incoming AS (
+			SELECT DISTINCT ON (x.scryfallid)
+				c.id AS cardid, x.collectornumber, x.multiverseid, x.scryfallid,
+				cs.id AS card_setid, x.rarity, x.language, x.imageurl, x.arturl
+			FROM jsonb_to_recordset(%s::JSONB) AS x(
+				name TEXT, "set" TEXT, collectornumber TEXT, multiverseid INTEGER,
+				scryfallid TEXT, rarity CHARACTER, language TEXT,
+				imageurl TEXT, arturl TEXT
+			)
+			JOIN card_name cn ON (cn.name_key = name_key(x.name) AND NOT cn.face)
+			JOIN card c ON (c.id = cn.cardid)
+			JOIN card_set cs ON (UPPER(cs.code) = UPPER(x.set))
+			WHERE NOT EXISTS (
+				SELECT 1 FROM printing WHERE scryfallid = x.scryfallid
+			)
+			ORDER BY x.scryfallid, c.id, cs.id
+		), deduped AS (
+			SELECT DISTINCT ON (i.cardid, i.collectornumber, i.card_setid) i.*
+			FROM incoming i
+			WHERE NOT EXISTS (
+				SELECT 1 FROM printing
+				WHERE cardid = i.cardid
+				AND collectornumber = i.collectornumber
+				AND card_setid = i.card_setid
+			)
+			ORDER BY i.cardid, i.collectornumber, i.card_setid, i.scryfallid
+		), inserted AS (
+			INSERT INTO printing (
+				cardid, collectornumber, multiverseid, scryfallid,
+				card_setid,
+				rarity, language, imageurl, arturl
+			) SELECT
+				cardid, collectornumber, multiverseid, scryfallid,
+				card_setid,
+				rarity, language, imageurl, arturl
+			FROM deduped
+			ON CONFLICT (scryfallid) DO NOTHING
+			RETURNING id, scryfallid, cardid
+		) SELECT COALESCE(
+			json_agg(json_build_object(
+				'id', id, 'scryfallid', scryfallid, 'cardid', cardid
+			)),
+			'[]'
+		) AS printings
+		FROM inserted
+		""",
+		(data,),
+		returning=True
+	)
+
+	# Fill in image URLs for printings imported before they were stored
+	mutate_query(
+		"""
+		UPDATE printing SET
+			imageurl = x.imageurl,
+			arturl = x.arturl
+		FROM jsonb_to_recordset(%s::JSONB) AS x(
+			scryfallid TEXT, imageurl TEXT, arturl TEXT
+		)
+		WHERE printing.scryfallid = x.scryfallid
+		AND printing.imageurl IS NULL
+		AND x.imageurl IS NOT NULL
+		""",
+		(data,)
+	)
+
+	by_scryfallid = {c['scryfallid']: c for c in cards}
+	printings = []
+	for p in new['printings']:
+		c = dict(by_scryfallid[p['scryfallid']])
+		c['id'] = p['id']
+		c['cardid'] = p['cardid']
+		printings.append(c)
+
+	autocomplete.index.add([
+		{'id': p['cardid'], 'name': p['name']} for p in printings
+	])
+
+	if prewarm_images and printings:
+		from web import asynchro
+		printingids = [p['id'] for p in printings]
+		for lot in functions.chunks(printingids, 500):
+			asynchro.fetch_images.delay(lot)
+
+	result = {
+		'inserted': len(printings),
+		'skipped': len(by_scryfallid) - len(printings),
+		'printings': printings
+	}
+	print('Inserted {} printings, skipped {}.'.format(
+		result['inserted'],
+		result['skipped']
+	))
+	return result
+
+
+def import_bulk_file(
+	filename: str,
+	chunk_size: int = 1000,
+	resume: bool = True,
+	prewarm_images: bool = False
+) -> dict:
+	"""
+	Stream a Scryfall bulk data file into the database in chunks, so memory use
+	is bounded by the chunk size rather than the file size.
+
+	The number of cards committed is recorded alongside the file after every
+	chunk, allowing an interrupted import to resume from the last chunk. The
+	file's size & modification time are recorded with it, so progress through
+	a file since downloaded again under the same name is ignored.
+	"""
+	progress_filename = '{}.progress'.format(filename)
+	stat = os.stat(filename)
+	source = {'size': stat.st_size, 'mtime': stat.st_mtime}
+	done = 0
+	if resume and os.path.exists(progress_filename):
+		with open(progress_filename) as f:
+			try:
+				progress = json.load(f)
+			except ValueError:
+				progress = None
+		if isinstance(progress, dict) and progress.get('source') == source:
+			done = progress['done']
+			print('Resuming import of {} after {} cards.'.format(
+				filename,
+				done
+			))
+		else:
+			print('Ignoring progress of a different {}.'.format(filename))
+
+	totals = {'inserted': 0, 'skipped': 0}
+	cards = (
+		scryfall.simplify(c)
+		for c in scryfall.iter_bulk_file(filename, skip=done)
+	)
+	for chunk in functions.chunks(cards, chunk_size):
+		result = bulk_import_cards(chunk, prewarm_images=prewarm_images)
+		totals['inserted'] += result['inserted']
+		totals['skipped'] += result['skipped']
+
+		done += len(chunk)
+		with open(progress_filename, 'w') as f:
+			json.dump({'source': source, 'done': done}, f)
+		print('Imported {} cards from {}.'.format(done, filename))
+
+	if os.path.exists(progress_filename):
+		os.remove(progress_filename)
+
+	return totals
+
+
+def _import_sets(cards: list) -> None:
+	sets = {}
+	for c in cards:
+		sets.setdefault(c['set'], c['set_name'])
+	if not sets:
+		return
+
+	# Check which sets we already have a record of in one go
+	existing = fetch_query(
+		"SELECT UPPER(code) AS code FROM card_set WHERE UPPER(code) = ANY(%s)",
+		([code.upper() for code in sets],)
+	)
+	existing_codes = {s['code'] for s in existing}
+
+	new_sets = []
+	for code in sets:
+		if code.upper() in existing_codes:
+			continue
+		resp = scryfall.get_set(code)
+		new_sets.append({
+			'name': resp['name'],
+			'code': code,
+			'released': resp['released_at'],
+			'tcgplayer_groupid': resp.get('tcgplayer_id')
+		})
+	if not new_sets:
+		return
+
+	mutate_query(
+		"""
+		INSERT INTO card_set (
+			name, code, released, tcgplayer_groupid
+		) SELECT
+			x.name, x.code, x.released, x.tcgplayer_groupid
+		FROM jsonb_to_recordset(%s::JSONB) AS x(
+			name TEXT, code TEXT, released DATE, tcgplayer_groupid INTEGER
+		)
+		WHERE NOT EXISTS (
+			SELECT 1 FROM card_set WHERE UPPER(code) = UPPER(x.code)
+		)
+		""",
+		(json.dumps(new_sets),)
+	)
+	cache.bump_set_version()
@@ -1,42 +1,40 @@
 # Standard library imports
+import json
 import re
 
 # Third party imports
 from flask import session, url_for
 
 # Local imports
+from web import cache
 from flasktools.db import fetch_query, mutate_query
 
 
+# Latest printing of the deck's art card, for fetching the art
+LATEST_ART_PRINTING = """LEFT JOIN LATERAL (
+			SELECT p.collectornumber, cs.code
+			FROM printing p
+			LEFT JOIN card_set cs ON (cs.id = p.card_setid)
+			WHERE p.cardid = d.cardartid
+			ORDER BY cs.released DESC LIMIT 1
+		) lp ON true"""
+
+
 def get_all(deleted: bool) -> dict:
 	decks = fetch_query(
 		"""
 		SELECT
-			d.id, d.name, get_format(d.formatid) AS formatname,
-			d.cardartid, d.cardartid AS cardid
+			d.id, d.name, f.name AS formatname,
+			d.cardartid, d.cardartid AS cardid,
+			lp.collectornumber, lp.code
 		FROM deck d
+		LEFT JOIN format f ON (f.id = d.formatid)
+		{}
 		WHERE d.deleted = %s AND d.userid = %s
 		ORDER BY d.formatid, d.name
-		""",
+		""".format(LATEST_ART_PRINTING),
 		(deleted, session['userid'],)
 	)
-	for d in decks:
-		# Temporary until I can incorporate this into the first query
-		card = fetch_query(
-			"""
-			SELECT
-				p.collectornumber, cs.code
-			FROM printing p
-			LEFT JOIN card_set cs ON (cs.id = p.card_setid)
-			WHERE p.cardid = %s
-			ORDER BY cs.released DESC LIMIT 1
-			""",
-			(d['cardid'],),
-			single_row=True
-		)
-		if card:
-			d['collectornumber'] = card['collectornumber']
-			d['code'] = card['code']
 	return decks
 
 
@@ -46,58 +44,50 @@ def get(deckid: int) -> dict:
 		SELECT
 			d.id, d.name, d.formatid, d.deleted,
 			d.cardartid, d.cardartid AS cardid,
-			d.notes
+			d.notes,
+			lp.collectornumber, lp.code
 		FROM deck d
+		{}
 		WHERE d.userid = %s AND d.id = %s
-		""",
+		""".format(LATEST_ART_PRINTING),
 		(session['userid'], deckid,),
 		single_row=True
 	)
-	# Temporary until I can incorporate this into the first query
-	card = fetch_query(
-		"""
-		SELECT
-			p.collectornumber, cs.code
-		FROM printing p
-		LEFT JOIN card_set cs ON (cs.id = p.card_setid)
-		WHERE p.cardid = %s
-		ORDER BY cs.released DESC LIMIT 1
-		""",
-		(result['cardid'],),
-		single_row=True
-	)
-	result['collectornumber'] = card['collectornumber']
-	result['code'] = card['code']
 	return result
 
 
 def get_cards(deckid: int) -> tuple:
 	qry = """SELECT dc.id, dc.cardid, dc.quantity, dc.section,
 				c.name,
-				total_printings_owned(d.userid, dc.cardid) AS has_quantity,
-				c.typeline, c.manacost, COALESCE(t.name, 'Other') AS cardtype,
-				is_basic_land(c.id) AS basic_land
+				COALESCE(o.quantity, 0) AS has_quantity,
+				c.typeline, c.manacost, c.manasymbols,
+				COALESCE(t.name, 'Other') AS cardtype,
+				c.basic_land
 			FROM deck_card dc
 			LEFT JOIN deck d ON (d.id = dc.deckid)
 			LEFT JOIN card c ON (c.id = dc.cardid)
+			LEFT JOIN user_card_owned o ON (
+				o.userid = d.userid AND o.cardid = dc.cardid
+			)
 			LEFT JOIN card_type t ON (t.id = c.card_typeid)
 			WHERE d.id = %s
 			AND d.userid = %s
-			ORDER BY card_typeid, is_basic_land(c.id), c.name"""
+			ORDER BY card_typeid, c.basic_land, c.name"""
 	qargs = (deckid, session['userid'],)
 	cards = fetch_query(qry, qargs)
 
+	symbol_url = url_for('static', filename='symbols/')
 	main, sideboard = [], []
 	for c in cards:
-		manasymbols = []
-		if c['manacost'] is not None:
-			for sym in re.findall(r'{[A-Z0-9/]+}', c['manacost']):
-				if sym in MANASYMBOL_IMG:
-					filename = 'symbols/{}'.format(MANASYMBOL_IMG[sym])
-					manasymbols.append(url_for('static', filename=filename))
-				else:
-					manasymbols.append(sym)
-		c['manacost'] = manasymbols
+		manasymbols = c['manasymbols']
+		if manasymbols is None:
+			# Card imported before symbols were stored
+			manasymbols = parse_manacost(c['manacost'])
+		c['manacost'] = [
+			sym if sym.startswith('{') else symbol_url + sym
+			for sym in manasymbols
+		]
+		del c['manasymbols']
 
 		c['insufficient_quantity'] = c['has_quantity'] < c['quantity']
 		if c['basic_land']:
@@ -112,29 +102,88 @@ def get_cards(deckid: int) -> tuple:
 	return main, sideboard
 
 
+def parse_manacost(manacost: str) -> list:
+	"""
+	Symbols of a mana cost, as the image filename of each symbol under
+	static/symbols, or the symbol itself (e.g. {H}) if it has no image.
+	"""
+	if manacost is None:
+		return []
+	return [
+		MANASYMBOL_IMG.get(sym, sym)
+		for sym in re.findall(r'{[A-Z0-9/]+}', manacost)
+	]
+
+
 def get_formats() -> list:
 	formats = fetch_query("SELECT id, name FROM format ORDER BY id")
 	return formats
 
 
 def parse_types(cards: list) -> list:
+	counts = {}
+	for c in cards:
+		counts[c['cardtype']] = counts.get(c['cardtype'], 0) + c['quantity']
+
 	prev_type = None
 	new_rows = []
 	for c in cards:
 		if c['cardtype'] != prev_type:
 			prev_type = c['cardtype']
-			count = sum([
-				x['quantity']
-				for x in cards
-				if x.get('cardtype') == prev_type
-			])
-			new_rows.append({'is_type': True, 'label': prev_type, 'count': count})
+			new_rows.append({
+				'is_type': True,
+				'label': prev_type,
+				'count': counts[prev_type]
+			})
 		new_rows.append(c)
 
 	return new_rows
 
 
+def store_manasymbols() -> int:
+	"""Parse & store mana symbols for cards imported before they were stored."""
+	cards = fetch_query(
+		"SELECT id, manacost FROM card WHERE manasymbols IS NULL"
+	)
+	mutate_query(
+		"UPDATE card SET manasymbols = %(manasymbols)s WHERE id = %(id)s",
+		[
+			{'id': c['id'], 'manasymbols': parse_manacost(c['manacost'])}
+			for c in cards
+		],
+		executemany=True
+	)
+	return len(cards)
+
+
+def resolve_names(names: list) -> dict:
+	"""
+	Card ID of each name, matched through the card_name lookup table in one
+	query. Names of a face of multifaced cards (A // B) match the card too.
+	"""
+	cards = fetch_query(
+		"""
+		SELECT x.name, match_card(x.name) AS id
+		FROM unnest(%s::TEXT[]) AS x(name)
+		""",
+		(list(set(names)),)
+	)
+	return {c['name']: c['id'] for c in cards if c['id'] is not None}
+
+
 def do_import(name: str, cards: list, notes: str = None) -> None:
+	cardids = resolve_names([c['name'] for c in cards])
+	rows = []
+	for c in cards:
+		if c['name'] in cardids:
+			rows.append({
+				'cardid': cardids[c['name']],
+				'quantity': c['quantity'],
+				'section': c['section']
+			})
+		else:
+			notes = (notes or '') + "Couldn't find card: {}\n".format(c['name'])
+
 	deckid = mutate_query(
 		"""
 		INSERT INTO deck (name, userid, formatid, notes)
@@ -151,8 +200,18 @@ def do_import(name: str, cards: list, notes: str = None) -> None:
 		(name, session['userid'], notes,),
 		returning=True)['id']
 
-	for c in cards:
-		_import_card(deckid, c)
+	mutate_query(
+		"""
+		INSERT INTO deck_card (
+			deckid, cardid, quantity, section
+		) SELECT
+			%s, x.cardid, x.quantity, x.section
+		FROM jsonb_to_recordset(%s::JSONB) AS x(
+			cardid INTEGER, quantity INTEGER, section TEXT
+		)
+		""",
+		(deckid, json.dumps(rows),)
+	)
 
 	qry = """UPDATE deck SET cardartid = (
 				SELECT id FROM card WHERE EXISTS (
@@ -160,17 +219,7 @@ def do_import(name: str, cards: list, notes: str = None) -> None:
 				) ORDER BY random() LIMIT 1
 			) WHERE id = %s"""
 	mutate_query(qry, (deckid,))
-
-
-def _import_card(deckid: int, card: dict) -> None:
-	print('Importing deck card {}'.format(card['name']))
-	mutate_query(
-		"""
-		INSERT INTO deck_card (deckid, cardid, quantity, section)
-		VALUES (%s, deck_card_match(%s, %s), %s, %s)
-		""",
-		(deckid, card['name'], session['userid'], card['quantity'], card['section'],)
-	)
+	cache.bump_user_version(session['userid'])
 
 
 MANASYMBOL_IMG = {
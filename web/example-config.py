@@ -3,12 +3,40 @@ TCGPLAYER_PUBLICKEY = 'publickey'
 TCGPLAYER_PRIVATEKEY = 'privatekey'
 OPENEXCHANGERATES_APPID = 'appid'
 
+# Number of TCGplayer pricing requests to keep in flight during a price update
+TCGPLAYER_CONCURRENCY = 4
+
+# Outbound HTTP: (connect, read) timeout in seconds, retries on 429/5xx with
+# exponential backoff, and the connection pool size per host for each worker
+HTTP_TIMEOUT = (5, 30)
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+HTTP_POOL_SIZE = 10
+
+# Number of images to download at once when fetching images in bulk
+IMAGE_CONCURRENCY = 8
+
+# Have the web server send images from /images/<name> itself, using
+# 'nginx' (X-Accel-Redirect to IMAGE_ACCEL_PREFIX, an internal location
+# aliased to static/images/) or 'apache' (X-Sendfile). None serves them as
+# regular static files.
+IMAGE_SENDFILE = None
+IMAGE_ACCEL_PREFIX = '/protected/'
+
+# Daily prices are rolled up into weekly & monthly averages once older than
+# PRICE_HISTORY_DAILY_RETENTION, & weekly averages are dropped once older than
+# PRICE_HISTORY_WEEKLY_RETENTION (both Postgres intervals)
+PRICE_HISTORY_DAILY_RETENTION = '6 months'
+PRICE_HISTORY_WEEKLY_RETENTION = '2 years'
+
 DBHOST = 'localhost'
 DBPORT = '5432'
 DBNAME = 'collector'
 DBUSER = 'postgres'
 DBPASS = 'password'
 
+REDIS_URL = 'redis://localhost:6379/0'
+
 ROLLBAR_TOKEN = 'rollbartoken'
 
 SECRETKEY = 'secretkey'
@@ -1,3 +1,14 @@
+# Standard library imports
+import base64
+import binascii
+import codecs
+import csv
+import datetime
+import decimal
+import itertools
+import json
+from typing import Iterable, Iterator
+
 
 def make_float(val: any) -> float:
 	try:
@@ -19,3 +30,38 @@ def pagecount(count: int, limit: int) -> int:
 			if limit % count != 0:
 				pages = math.ceil(pages)
 	return int(pages)
+
+
+def chunks(iterable: Iterable, size: int) -> Iterator[list]:
+	iterator = iter(iterable)
+	while True:
+		chunk = list(itertools.islice(iterator, size))
+		if not chunk:
+			return
+		yield chunk
+
+
+def encode_cursor(data: dict) -> str:
+	def default(val: any) -> any:
+		if isinstance(val, (datetime.date, decimal.Decimal)):
+			return str(val)
+		raise TypeError(type(val))
+
+	encoded = json.dumps(data, default=default, separators=(',', ':'))
+	return base64.urlsafe_b64encode(encoded.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+	try:
+		return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+	except (binascii.Error, ValueError):
+		return None
+
+
+def read_csv(stream: any) -> csv.DictReader:
+	"""
+	Rows of an uploaded CSV file, decoded straight from its binary stream. The
+	stream may be a temporary file without readable(), so it isn't wrapped in
+	io.TextIOWrapper.
+	"""
+	return csv.DictReader(codecs.getreader('utf-8-sig')(stream))
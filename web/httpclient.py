@@ -0,0 +1,82 @@
+# Standard library imports
+import os
+import threading
+from urllib.parse import urlsplit
+
+# Third party imports
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Local imports
+from web import config
+
+# Keep-alive sessions for this worker, one per host
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Sessions hold open sockets, which can't be shared with forked workers
+if hasattr(os, 'register_at_fork'):
+	os.register_at_fork(after_in_child=_sessions.clear)
+
+
+def _new_session() -> requests.Session:
+	retry = Retry(
+		total=getattr(config, 'HTTP_RETRIES', 3),
+		backoff_factor=getattr(config, 'HTTP_BACKOFF', 0.5),
+		status_forcelist=(429, 500, 502, 503, 504),
+		method_whitelist=frozenset(['GET', 'POST']),
+		# Hand the last response back so callers can raise_for_status as usual
+		raise_on_status=False
+	)
+	adapter = HTTPAdapter(
+		pool_connections=1,
+		pool_maxsize=getattr(config, 'HTTP_POOL_SIZE', 10),
+		pool_block=True,
+		max_retries=retry
+	)
+	session = requests.Session()
+	session.mount('https://', adapter)
+	session.mount('http://', adapter)
+	return session
+
+
+def session_for(url: str) -> requests.Session:
+	host = urlsplit(url).netloc
+	with _sessions_lock:
+		if host not in _sessions:
+			_sessions[host] = _new_session()
+		return _sessions[host]
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+	kwargs.setdefault('timeout', getattr(config, 'HTTP_TIMEOUT', (5, 30)))
+	return session_for(url).request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+	return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+	return request('POST', url, **kwargs)
+
+
+def download(filename: str, url: str) -> None:
+	response = get(url, stream=True)
+	response.raise_for_status()
+	# Write to a temporary file first so a partial download is never served
+	tmp_filename = '{}.{}.{}.tmp'.format(
+		filename,
+		os.getpid(),
+		threading.get_ident()
+	)
+	try:
+		with open(tmp_filename, 'wb') as f:
+			for block in response.iter_content(chunk_size=1024 * 64):
+				f.write(block)
+		os.replace(tmp_filename, filename)
+	except BaseException:
+		if os.path.exists(tmp_filename):
+			os.remove(tmp_filename)
+		raise
@@ -0,0 +1,273 @@
+# Standard library imports
+import hashlib
+import json
+import os
+import re
+import threading
+
+# Third party imports
+from flask import url_for
+from PIL import Image
+
+# Local imports
+from web import cache, config, httpclient
+from flasktools import get_static_file, serve_static_file
+
+# Seconds before a queued image fetch is assumed lost (or failed) and the
+# image may be queued again
+PENDING_EXPIRY = 60 * 10
+
+# Smaller WebP copies created for each kind of image, by maximum width. The
+# full size WebP is used where no smaller variant is suitable.
+VARIANTS = {
+	'card_image': {'small': 244, 'full': None},
+	'card_art': {'small': 320, 'full': None}
+}
+
+
+# Images are stored under the static folder in two levels of subdirectories
+# named from a hash of the filename, e.g. images/3f/a2/card_art_1.jpg
+IMAGE_DIR = 'images'
+
+
+def static_path(name: str) -> str:
+	"""Path of an image relative to the static folder."""
+	digest = hashlib.md5(name.encode()).hexdigest()
+	return '/'.join([IMAGE_DIR, digest[0:2], digest[2:4], name])
+
+
+def path(name: str) -> str:
+	"""Absolute path of an image."""
+	return get_static_file('/' + static_path(name))
+
+
+def make_dir(filename: str) -> None:
+	"""Create the directory of an image about to be written."""
+	os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+
+def download(filename: str, url: str) -> None:
+	make_dir(filename)
+	httpclient.download(filename, url)
+
+
+def url(name: str) -> str:
+	"""
+	URL of an image, which is served by the web server directly through
+	X-Accel-Redirect/X-Sendfile if IMAGE_SENDFILE is configured.
+	"""
+	if getattr(config, 'IMAGE_SENDFILE', None):
+		return url_for('image', name=name)
+	return serve_static_file(static_path(name))
+
+
+def sendfile_headers(name: str) -> dict:
+	"""Headers to have the web server send an image (see url)."""
+	if config.IMAGE_SENDFILE == 'nginx':
+		# Internal location aliased to the images directory
+		prefix = getattr(config, 'IMAGE_ACCEL_PREFIX', '/protected/')
+		location = prefix + static_path(name)[len(IMAGE_DIR) + 1:]
+		return {'X-Accel-Redirect': location}
+	return {'X-Sendfile': get_static_file('/' + static_path(name))}
+
+
+def migrate_flat() -> int:
+	"""Move images from the old flat images directory into the sharded layout."""
+	directory = get_static_file('/' + IMAGE_DIR)
+	count = 0
+	with os.scandir(directory) as entries:
+		for e in entries:
+			if e.is_file() and not e.name.startswith('.'):
+				filename = path(e.name)
+				make_dir(filename)
+				os.replace(e.path, filename)
+				count += 1
+	return count
+
+
+class ImageIndex:
+	"""
+	Tracks which images are present on disk and which are already queued for
+	fetching, so the filesystem isn't checked for every card on every request
+	and the same image is never queued twice while a fetch is pending.
+
+	Present images are held in memory, warmed by a single scan of the image
+	store. Pending fetches are shared by all workers through Redis.
+	"""
+	def __init__(self) -> None:
+		self._present = None
+		self._lock = threading.Lock()
+
+	def _scan(self) -> None:
+		with self._lock:
+			if self._present is None:
+				present = set()
+				directory = get_static_file('/' + IMAGE_DIR)
+				for _, _, files in os.walk(directory):
+					present.update(f for f in files if not is_partial(f))
+				self._present = present
+
+	@staticmethod
+	def _pending_key(name: str) -> str:
+		return cache.key('image', 'pending', name)
+
+	def exists(self, filename: str) -> bool:
+		if self._present is None:
+			self._scan()
+		return os.path.basename(filename) in self._present
+
+	def claim(self, filename: str) -> bool:
+		"""
+		Mark an image as pending, returning whether the caller should fetch it:
+		false if it's present or already pending.
+		"""
+		if self.exists(filename):
+			return False
+
+		name = os.path.basename(filename)
+		queued = cache.get_redis().set(
+			self._pending_key(name),
+			1,
+			nx=True,
+			ex=PENDING_EXPIRY
+		)
+		if not queued:
+			return False
+
+		# May have been fetched since the directory was scanned
+		if os.path.exists(filename):
+			self._present.add(name)
+			cache.get_redis().delete(self._pending_key(name))
+			return False
+
+		return True
+
+	def request(self, filename: str, task: any, *args: any) -> None:
+		"""Queue `task` with `args` to fetch the image, unless not needed."""
+		if self.claim(filename):
+			task.delay(*args)
+
+	def fetched(self, filename: str) -> None:
+		"""Mark an image as successfully fetched by a task."""
+		name = os.path.basename(filename)
+		if self._present is not None:
+			self._present.add(name)
+		cache.get_redis().delete(self._pending_key(name))
+
+
+index = ImageIndex()
+
+
+def _kind(name: str) -> str:
+	for kind in VARIANTS:
+		if name.startswith(kind + '_'):
+			return kind
+	return None
+
+
+def create_variants(filename: str, bump_version: bool = True) -> dict:
+	"""
+	Create the resized WebP variants of a downloaded image. Variant filenames
+	include a hash of the original image, so they can be cached forever. The
+	image version is only bumped if the variants changed, and callers creating
+	many at once may pass `bump_version=False` to bump it once themselves.
+	"""
+	name = os.path.basename(filename)
+	kind = _kind(name)
+	if kind is None:
+		return {}
+
+	with open(filename, 'rb') as f:
+		digest = hashlib.sha1(f.read()).hexdigest()[:12]
+	stem = os.path.splitext(name)[0]
+
+	variants = {}
+	written = False
+	with Image.open(filename) as original:
+		original = original.convert('RGB')
+		for variant, width in VARIANTS[kind].items():
+			variant_name = '{}.{}.{}.webp'.format(stem, digest, variant)
+			variant_filename = path(variant_name)
+			make_dir(variant_filename)
+			if not os.path.exists(variant_filename):
+				written = True
+				img = original.copy()
+				if width is not None and img.width > width:
+					img.thumbnail((width, img.height), Image.LANCZOS)
+				tmp_filename = '{}.tmp'.format(variant_filename)
+				img.save(tmp_filename, 'WEBP', quality=80, method=4)
+				os.replace(tmp_filename, variant_filename)
+			variants[variant] = variant_name
+
+	if written or recorded_variants(name) != variants:
+		cache.get_redis().hset(
+			cache.key('image', 'variants'),
+			name,
+			json.dumps(variants)
+		)
+		_variants[name] = variants
+		# Responses embedding this image's URL now point at a variant instead
+		if bump_version:
+			cache.bump_image_version()
+	return variants
+
+
+# Variants known to this worker, which never change once created
+_variants = {}
+
+_variant_regex = re.compile(r'\.[0-9a-f]{12}\.\w+\.(webp|svg)$')
+
+
+def recorded_variants(name: str) -> dict:
+	"""Variants recorded for an image, or None if none have been created."""
+	if name not in _variants:
+		found = cache.get_redis().hget(cache.key('image', 'variants'), name)
+		if found is not None:
+			_variants[name] = json.loads(found)
+	return _variants.get(name)
+
+
+def has_variants(filename: str) -> bool:
+	return recorded_variants(os.path.basename(filename)) is not None
+
+
+def is_partial(filename: str) -> bool:
+	"""Whether a file is an image still being written, before being renamed."""
+	return filename.endswith('.tmp')
+
+
+def is_variant(filename: str) -> bool:
+	"""Whether an image is a variant (or sprite) named by a content hash."""
+	return _variant_regex.search(filename) is not None
+
+
+def urls(names: list, variant: str) -> dict:
+	"""
+	URL of the given variant of each image, falling back to the original image
+	until its variants have been created.
+	"""
+	missing = [n for n in set(names) if n not in _variants]
+	if missing:
+		found = cache.get_redis().hmget(cache.key('image', 'variants'), missing)
+		for name, variants in zip(missing, found):
+			if variants is not None:
+				_variants[name] = json.loads(variants)
+
+	resp = {}
+	for name in names:
+		resp[name] = url(_variants.get(name, {}).get(variant, name))
+	return resp
+
+
+def create_all_variants() -> int:
+	"""Create any missing variants for every image already downloaded."""
+	directory = get_static_file('/' + IMAGE_DIR)
+	count = 0
+	for dirpath, _, files in os.walk(directory):
+		for name in files:
+			if _kind(name) and not is_variant(name) and not is_partial(name):
+				create_variants(os.path.join(dirpath, name), bump_version=False)
+				count += 1
+	if count:
+		cache.bump_image_version()
+	return count
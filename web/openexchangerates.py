@@ -1,9 +1,8 @@
 # Standard library imports
-import requests
 import json
 
 # Local imports
-from web import config
+from web import config, httpclient
 
 
 class OpenExchangeRatesException(Exception):
@@ -12,7 +11,7 @@ class OpenExchangeRatesException(Exception):
 
 def get() -> dict:
 	params = {'app_id': config.OPENEXCHANGERATES_APPID, 'base': 'USD'}
-	response = requests.get(
+	response = httpclient.get(
 		'https://openexchangerates.org/api/latest.json',
 		params=params
 	)
@@ -0,0 +1,141 @@
+"""
+Price history of printings, downsampled in the database so long histories
+are returned as a bounded number of points.
+"""
+# Local imports
+from web import functions
+from flasktools.db import fetch_query
+
+# Points returned per printing, unless asked for otherwise
+DEFAULT_POINTS = 120
+MAX_POINTS = 1000
+
+# Printings per request
+MAX_PRINTINGS = 500
+
+SERIES = (
+	'price', 'price_min', 'price_max',
+	'foilprice', 'foilprice_min', 'foilprice_max'
+)
+
+
+def get(printingids: list, userid: int, points: int = DEFAULT_POINTS) -> list:
+	"""
+	Price history of each printing in the user's currency, as arrays of dates
+	with the average, minimum & maximum price over each of up to `points`
+	equal spans of time. Days no longer kept are covered by their weekly, then
+	monthly, rollups, whose averages are weighted by the days they cover. Only
+	rollups ending by the start of finer history are used, so no day is
+	counted twice.
+	"""
+	if len(printingids) > MAX_PRINTINGS:
+		raise ValueError('At most {} printings at once.'.format(MAX_PRINTINGS))
+	points = max(1, min(points, MAX_POINTS))
+	rows = fetch_query(
+		"""
+		WITH daily AS (
+			SELECT
+				printingid, created AS day,
+				price::NUMERIC AS price,
+				price::NUMERIC AS price_min,
+				price::NUMERIC AS price_max,
+				(price IS NOT NULL)::INTEGER AS price_samples,
+				foilprice::NUMERIC AS foilprice,
+				foilprice::NUMERIC AS foilprice_min,
+				foilprice::NUMERIC AS foilprice_max,
+				(foilprice IS NOT NULL)::INTEGER AS foilprice_samples
+			FROM price_history
+			WHERE printingid = ANY(%(printingids)s)
+		), daily_start AS (
+			SELECT printingid, MIN(day) AS day
+			FROM daily
+			GROUP BY printingid
+		), rollups AS (
+			SELECT
+				printingid, period, period_start AS day,
+				price_avg AS price, price_min, price_max, price_samples,
+				foilprice_avg AS foilprice, foilprice_min, foilprice_max,
+				foilprice_samples
+			FROM price_history_rollup
+			WHERE printingid = ANY(%(printingids)s)
+		), weekly AS (
+			SELECT r.* FROM rollups r
+			LEFT JOIN daily_start d ON (d.printingid = r.printingid)
+			WHERE r.period = 'week'
+			AND r.day + INTERVAL '1 week' <= COALESCE(d.day, 'infinity')
+		), weekly_start AS (
+			SELECT printingid, MIN(day) AS day
+			FROM weekly
+			GROUP BY printingid
+		), monthly AS (
+			SELECT r.* FROM rollups r
+			LEFT JOIN weekly_start w ON (w.printingid = r.printingid)
+			LEFT JOIN daily_start d ON (d.printingid = r.printingid)
+			WHERE r.period = 'month'
+			AND r.day + INTERVAL '1 month' <= COALESCE(w.day, d.day, 'infinity')
+		), history AS (
+			SELECT * FROM daily
+			UNION ALL
+			SELECT
+				printingid, day, price, price_min, price_max, price_samples,
+				foilprice, foilprice_min, foilprice_max, foilprice_samples
+			FROM weekly
+			UNION ALL
+			SELECT
+				printingid, day, price, price_min, price_max, price_samples,
+				foilprice, foilprice_min, foilprice_max, foilprice_samples
+			FROM monthly
+		), bucketed AS (
+			SELECT
+				h.*,
+				width_bucket(
+					(h.day - b.first)::NUMERIC,
+					0,
+					(b.last - b.first + 1)::NUMERIC,
+					%(points)s
+				) AS bucket
+			FROM history h
+			JOIN (
+				SELECT printingid, MIN(day) AS first, MAX(day) AS last
+				FROM history
+				GROUP BY printingid
+			) b USING (printingid)
+		)
+		SELECT
+			b.printingid,
+			to_char(MIN(b.day), 'YYYY-MM-DD') AS day,
+			SUM(b.price * b.price_samples)
+				/ NULLIF(SUM(b.price_samples), 0)
+				* r.exchangerate AS price,
+			MIN(b.price_min) * r.exchangerate AS price_min,
+			MAX(b.price_max) * r.exchangerate AS price_max,
+			SUM(b.foilprice * b.foilprice_samples)
+				/ NULLIF(SUM(b.foilprice_samples), 0)
+				* r.exchangerate AS foilprice,
+			MIN(b.foilprice_min) * r.exchangerate AS foilprice_min,
+			MAX(b.foilprice_max) * r.exchangerate AS foilprice_max
+		FROM bucketed b
+		CROSS JOIN user_currency(%(userid)s) r
+		GROUP BY b.printingid, b.bucket, r.exchangerate
+		ORDER BY b.printingid, b.bucket
+		""",
+		{
+			'printingids': list(printingids),
+			'userid': userid,
+			'points': points
+		}
+	)
+
+	histories = {}
+	for row in rows:
+		if row['printingid'] not in histories:
+			histories[row['printingid']] = {
+				'printingid': row['printingid'],
+				'dates': [],
+				**{s: [] for s in SERIES}
+			}
+		history = histories[row['printingid']]
+		history['dates'].append(row['day'])
+		for s in SERIES:
+			history[s].append(functions.make_float(row[s]))
+	return list(histories.values())
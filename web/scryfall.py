@@ -1,6 +1,13 @@
 # Standard library imports
 import requests
 import json
+from typing import Iterator
+
+# Local imports
+from web import httpclient
+
+
+_BULK_READ_SIZE = 1024 * 64
 
 
 class ScryfallException(Exception):
@@ -17,9 +24,9 @@ def _send_request(
 	data: any = None,
 	post: bool = False
 ) -> any:
-	func = requests.get
+	func = httpclient.get
 	if post is True:
-		func = requests.post
+		func = httpclient.post
 	response = func(
 		'https://api.scryfall.com{}'.format(endpoint),
 		params=params,
@@ -60,11 +67,11 @@ def get(code: str, collectornumber: str) -> list:
 	return simplify(resp)
 
 
-def get_bulk(scryfall_ids: list) -> list:
+def get_bulk(scryfall_ids: list, skip_missing: bool = False) -> list:
 	data = {'identifiers': [{'id': x} for x in scryfall_ids]}
 	resp = _send_request('/cards/collection', data=json.dumps(data), post=True)
 	simple_resp = []
-	if resp['not_found']:
+	if resp['not_found'] and not skip_missing:
 		raise ScryfallException('Not found: {}'.format(resp['not_found']))
 	for r in resp['data']:
 		simple_resp.append(simplify(r))
@@ -72,12 +79,57 @@ def get_bulk(scryfall_ids: list) -> list:
 
 
 def bulk_file_import(filename: str) -> list:
-	with open(filename) as f:
-		data = json.loads(f.read())
-	simple_resp = []
-	for r in data:
-		simple_resp.append(simplify(r))
-	return simple_resp
+	return [simplify(r) for r in iter_bulk_file(filename)]
+
+
+def iter_bulk_file(filename: str, skip: int = 0) -> Iterator[dict]:
+	"""
+	Incrementally parse a Scryfall bulk data file (a single JSON array),
+	yielding one card at a time so the whole file is never held in memory.
+	The first `skip` cards are parsed but not yielded.
+	"""
+	decoder = json.JSONDecoder()
+	with open(filename, encoding='utf-8') as f:
+		buf = ''
+		pos = 0
+		eof = False
+		started = False
+		index = 0
+		while True:
+			# Skip whitespace & separators between array items
+			while pos < len(buf) and buf[pos] in ' \t\r\n,':
+				pos += 1
+
+			if pos < len(buf):
+				if not started:
+					if buf[pos] != '[':
+						raise ScryfallException('Bulk file is not a JSON array.')
+					started = True
+					pos += 1
+					continue
+				if buf[pos] == ']':
+					return
+				try:
+					obj, end = decoder.raw_decode(buf, pos)
+				except json.JSONDecodeError:
+					if eof:
+						raise
+				else:
+					if index >= skip:
+						yield obj
+					index += 1
+					pos = end
+					continue
+			elif eof:
+				if started:
+					raise ScryfallException('Unexpected end of bulk file.')
+				return
+
+			# Need more data, discarding what has already been parsed
+			block = f.read(_BULK_READ_SIZE)
+			eof = block == ''
+			buf = buf[pos:] + block
+			pos = 0
 
 
 def simplify(resp: dict) -> dict:
@@ -0,0 +1,30 @@
+"""
+Card name searching, backed by trigram indexes on the accent-folded,
+lower-cased name (see normalize_name in schema/functions.pgsql).
+"""
+
+
+def _escape_like(term: str) -> str:
+	return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def name_filter(term: str, column: str = 'c.name') -> tuple:
+	"""
+	SQL condition & args matching names containing the term, or with a word
+	close enough to it to allow for typos. Faces of multifaced cards (A // B)
+	are matched as part of the full name.
+	"""
+	qry = """(
+		normalize_name({col}) LIKE '%%' || normalize_name(%s) || '%%'
+		OR normalize_name(%s) <%% normalize_name({col})
+	)""".format(col=column)
+	return qry, (_escape_like(term), term,)
+
+
+def name_rank(term: str, column: str = 'c.name') -> tuple:
+	"""SQL expression & args ranking names by similarity to the term."""
+	qry = """word_similarity(
+		normalize_name(%s),
+		normalize_name({col})
+	)""".format(col=column)
+	return qry, (term,)
@@ -34,26 +34,30 @@ var search_req;
 var current_page = 1;
 var sort = 'name';
 var sort_desc = 'asc';
+// Cursor for the page after the current one, & the cursor to use for the next
+// request. Only used when moving to the next page, otherwise pages by number.
+var next_cursor = null;
+var page_cursor = null;
 function get_collection() {
 	if (search_req) search_req.abort();
+	var cursor = page_cursor;
+	page_cursor = null;
 	$('#collection_head').addClass('hide');
 	show_loading($('#collection_list'));
 	$('#collection_pagination, #collection_total').empty();
 
-	search_req = $.ajax({
-		url: "/get_collection",
-		method: "GET",
-		data: {
-			'page': current_page,
-			'sort': sort,
-			'sort_desc': sort_desc,
-			'filter_search': $('#search').val(),
-			'filter_set': $('#filter_set_value').val(),
-			'filter_rarity': $('#filter_rarity_value').val()
-		}
+	search_req = cached_get("/get_collection", {
+		'page': current_page,
+		'cursor': cursor,
+		'sort': sort,
+		'sort_desc': sort_desc,
+		'filter_search': $('#search').val(),
+		'filter_set': $('#filter_set_value').val(),
+		'filter_rarity': $('#filter_rarity_value').val()
 	}).done(function(data) {
 		if (data.error) M.toast({html: data.error});
 		else {
+			next_cursor = data.next_cursor;
 			$('#collection_head').removeClass('hide');
 			compile_handlebars('collection-template', '#collection_list', data);
 
@@ -64,7 +68,7 @@ function get_collection() {
 				compile_handlebars('hover-template', $(this).find('.card-hover-img'), {
 					'vert_pos': vert_pos,
 					'horiz_pos': horiz_pos,
-					'image_url': image_url
+					'image_url': $(this).closest('tr').data().thumb
 				});
 				$('#view_box').attr('src', image_url);
 			}, function() {
@@ -136,6 +140,7 @@ function generate_pagination(elem, count) {
 	});
 	elem.on('click', '.next-page', function() {
 		current_page++;
+		page_cursor = next_cursor;
 		get_collection();
 	});
 	elem.on('click', '.last-page', function() {
@@ -144,27 +149,94 @@ function generate_pagination(elem, count) {
 	});
 }
 
+// Lower-case & strip accents, the same as names are matched server side
+function normalize_name(name) {
+	return name.normalize('NFKD').replace(/[\u0300-\u036f]/g, '').toLowerCase();
+}
+
+// Maximum suggestions returned by /autocomplete
+var AUTOCOMPLETE_LIMIT = 10;
+
+// Last suggestions fetched, reused while the query only gets longer if they
+// were all the names starting with the earlier query
+var autocomplete_req;
+var autocomplete_last = null;
+function autocomplete_names(query) {
+	if (autocomplete_req) autocomplete_req.abort();
+
+	if (query.length < 2) {
+		hide_autocomplete();
+		return;
+	}
+
+	var key = normalize_name(query);
+	var last = autocomplete_last;
+	if (last && key.startsWith(last.key) && last.results.length < AUTOCOMPLETE_LIMIT) {
+		show_autocomplete(last.results.filter(function(r) {
+			return r.keys.some(function(k) { return k.startsWith(key); });
+		}));
+		return;
+	}
+
+	autocomplete_req = $.ajax({
+		url: "/autocomplete",
+		method: "GET",
+		data: { 'query':query }
+	}).done(function(data) {
+		var results = data.results.map(function(r) {
+			// Faces of multifaced cards are matched too
+			var keys = [normalize_name(r.name)].concat(normalize_name(r.name).split(' // '));
+			return {name: r.name, keys: keys};
+		});
+		autocomplete_last = {key: key, results: results};
+		show_autocomplete(results);
+	}).fail(ajax_failed);
+}
+
+// Rendered here rather than by M.Autocomplete, which filters suggestions
+// again on the raw text typed & so hides names matched without accents
+function show_autocomplete(results) {
+	if (!results.length) {
+		hide_autocomplete();
+		return;
+	}
+	compile_handlebars('autocomplete-template', '#search_autocomplete', {
+		names: results.map(function(r) { return r.name; })
+	});
+	$('#search_autocomplete').removeClass('hide');
+}
+
+function hide_autocomplete() {
+	$('#search_autocomplete').addClass('hide').empty();
+}
+
 var add_search_req;
-var add_search_timer;
-function add_search() {
+function add_search(query) {
 	if (!adding) return;
-	var query = $('#search').val()
 	if (query.length >= 3 || query.length == 0) {
-		clearTimeout(add_search_timer);
-		add_search_timer = setTimeout(function() {
-			if (add_search_req) add_search_req.abort();
-			add_search_req = $.ajax({
-				url: "/search",
-				method: "GET",
-				data: { 'query':query }
-			}).done(function(data) {
-				$('#search-results').removeClass('hide');
-				compile_handlebars('search-template', '#search-results-list', data);
-			}).fail(ajax_failed);
-		}, 250);
+		if (add_search_req) add_search_req.abort();
+		add_search_req = $.ajax({
+			url: "/search",
+			method: "GET",
+			data: { 'query':query }
+		}).done(function(data) {
+			$('#search-results').removeClass('hide');
+			compile_handlebars('search-template', '#search-results-list', data);
+		}).fail(ajax_failed);
 	}
 }
 
+// Search once typing pauses, rather than on every keystroke
+var search_timer;
+function run_search(suggest) {
+	var query = $('#search').val();
+	if (suggest) autocomplete_names(query);
+	add_search(query);
+
+	current_page = 1;
+	if (query.length >= 3 || query.length == 0) get_collection();
+}
+
 function bind_events() {
 	$('#filter-row-button').on('click', function() {
 		if (!sets_loaded) get_sets();
@@ -207,11 +279,7 @@ function bind_events() {
 	});
 
 	function populate_card(user_cardid) {
-		$.ajax({
-			url: "/collection/card",
-			method: "GET",
-			data: {user_cardid: user_cardid}
-		}).done(function(data) {
+		cached_get("/collection/card", {user_cardid: user_cardid}).done(function(data) {
 			if (data.error) M.toast({html: data.error});
 			else {
 				$('#info_modal .art').attr('src', data.card.arturl);
@@ -261,26 +329,31 @@ function bind_events() {
 		}).fail(ajax_failed);
 	}
 
-	var search_timer;
-	$('#search').on('keyup', function(e) {
-		// Only letters & enter key
-		if (e.which != 13 && (e.which > 90 || e.which < 48)) return;
-		search_handler();
+	$('#search').on('input', function() {
+		clearTimeout(search_timer);
+		search_timer = setTimeout(function() { run_search(true); }, 250);
 	});
 
-	$('#search').on('input', search_handler);
+	// Enter searches straight away, & Escape dismisses the suggestions
+	$('#search').on('keyup', function(e) {
+		if (e.which == 27) hide_autocomplete();
+		if (e.which != 13) return;
+		hide_autocomplete();
+		clearTimeout(search_timer);
+		run_search(false);
+	});
 
-	function search_handler() {
-		if (adding) add_search();
+	$('#search').on('blur', hide_autocomplete);
 
-		current_page = 1;
-		if ($(this).val().length >= 3 || $(this).val().length == 0) {
-			clearTimeout(search_timer);
-			search_timer = setTimeout(function() {
-				$('#search-row-button').click();
-			}, 250);
-		}
-	}
+	// Search for the picked name without suggesting names again. On mousedown,
+	// as the list is hidden when the search box loses focus.
+	$('#search_autocomplete').on('mousedown', '.collection-item', function(e) {
+		e.preventDefault();
+		$('#search').val($(this).text());
+		hide_autocomplete();
+		clearTimeout(search_timer);
+		run_search(false);
+	});
 
 	$('#search-row-button').on('click', function() {
 		get_collection();
@@ -308,7 +381,7 @@ function bind_events() {
 				data: { 'query':query }
 			}).done(function(data) {
 				M.toast({html: "Fetching cards from Scryfall."});
-				add_search();
+				add_search(query);
 			}).fail(ajax_failed);
 		}
 	});
@@ -450,12 +523,15 @@ function bind_events() {
 		var upload_req = new XMLHttpRequest();
 		upload_req.open("POST", "/csv_upload", true);
 		upload_req.onload = function(oEvent) {
-			$('#upload_loading').empty();
 			if (upload_req.status == 200) {
-				M.Modal.getInstance($('#upload_modal')).close();
-				M.toast({html: "Successfully Uploaded"});
-				get_collection();
+				var data = JSON.parse(upload_req.responseText);
+				if (data.error) {
+					$('#upload_loading').empty();
+					M.toast({html: data.error});
+				}
+				else poll_import(data.importid);
 			} else {
+				$('#upload_loading').empty();
 				M.toast({html: "An internal error occurred. Please try again later."});
 			}
 		};
@@ -463,6 +539,46 @@ function bind_events() {
 		upload_req.send(formdata);
 	});
 
+	// Imports are run in the background, so check on progress until done
+	function poll_import(importid) {
+		$.ajax({
+			url: "/csv_upload/status",
+			method: "GET",
+			data: {importid: importid}
+		}).done(function(data) {
+			if (data.error) {
+				$('#upload_loading').empty();
+				M.toast({html: data.error});
+			}
+			else if (data.status == 'complete') {
+				$('#upload_loading').empty();
+				M.Modal.getInstance($('#upload_modal')).close();
+				M.toast({html: "Successfully Uploaded"});
+				get_collection();
+			}
+			else if (data.status == 'partial') {
+				$('#upload_loading').empty();
+				M.Modal.getInstance($('#upload_modal')).close();
+				M.toast({html: "Uploaded, but " + data.unresolved + " rows could not be matched to a card"});
+				get_collection();
+			}
+			else if (data.status == 'failed') {
+				$('#upload_loading').empty();
+				M.toast({html: "Import failed. Please try again later."});
+				get_collection();
+			}
+			// Pending, running or retrying after an error
+			else {
+				var percent = data.total ? Math.round(data.complete / data.total * 100) : 0;
+				compile_handlebars('upload-progress-template', '#upload_loading', {percent: percent});
+				setTimeout(function() { poll_import(importid); }, 2000);
+			}
+		}).fail(function(jqXHR) {
+			$('#upload_loading').empty();
+			ajax_failed(jqXHR);
+		});
+	}
+
 	$('#filter_btn').on('click', function() {
 		var filters = [];
 		$('#filter_modal select').each(function() {
@@ -8,11 +8,7 @@ $(document).ready(function() {
 function show_details() {
 	show_loading($('#deck-details .deck-list'));
 
-	$.ajax({
-		url: "/decks/get",
-		method: "GET",
-		data: {'deckid': $('#deckid').val()}
-	}).done(function(data) {
+	cached_get("/decks/get", {'deckid': $('#deckid').val()}).done(function(data) {
 		if (data.error) M.toast({html: data.error});
 		else {
 			$('#edit-deck-art').attr('src', data.deck.arturl);
@@ -12,6 +12,34 @@ function ajax_failed(jqXHR) {
 	if (jqXHR.getAllResponseHeaders()) M.toast({html: "An internal error occurred. Please try again later."});
 }
 
+// Last response of each conditional GET, by URL & parameters, with its ETag
+var etag_cache = {};
+
+// GET that sends If-None-Match with the ETag of the last response, reusing
+// that response when the server answers 304 Not Modified
+function cached_get(url, data) {
+	var key = url + '?' + $.param(data || {});
+	var cached = etag_cache[key];
+	var deferred = $.Deferred();
+	var req = $.ajax({
+		url: url,
+		method: "GET",
+		data: data,
+		headers: cached ? {'If-None-Match': cached.etag} : {}
+	}).done(function(resp, status, jqXHR) {
+		if (jqXHR.status == 304) resp = cached.data;
+		else {
+			var etag = jqXHR.getResponseHeader('ETag');
+			if (etag) etag_cache[key] = {etag: etag, data: resp};
+		}
+		deferred.resolve(resp, status, jqXHR);
+	}).fail(deferred.reject);
+
+	var promise = deferred.promise();
+	promise.abort = function() { req.abort(); };
+	return promise;
+}
+
 function is_mobile() {
 	if(/Android|webOS|iPhone|iPad|iPod|BlackBerry|IEMobile|Opera Mini/i.test(navigator.userAgent) ) {
 		return true;
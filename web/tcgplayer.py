@@ -1,9 +1,14 @@
 # Standard library imports
-import requests
 import json
 
 # Local imports
-from web import config
+from web import cache, config, httpclient
+
+# Seconds before a token's expiry that it should no longer be used
+TOKEN_EXPIRY_MARGIN = 300
+
+# Maximum page size for catalog listings
+CATALOG_PAGE_SIZE = 100
 
 
 class TCGPlayerException(Exception):
@@ -15,17 +20,29 @@ def _send_request(
 	params: any = None,
 	data: any = None,
 	headers: dict = None,
-	post: bool = False
+	post: bool = False,
+	token: str = None
 ) -> any:
-	func = requests.get
+	func = httpclient.get
 	if post is True:
-		func = requests.post
-	response = func(
-		'https://api.tcgplayer.com{}'.format(endpoint),
-		params=params,
-		data=data,
-		headers=headers
-	)
+		func = httpclient.post
+	headers = dict(headers or {})
+	if token is not None:
+		headers.update(_auth_header(token))
+
+	def send():
+		return func(
+			'https://api.tcgplayer.com{}'.format(endpoint),
+			params=params,
+			data=data,
+			headers=headers
+		)
+
+	response = send()
+	if response.status_code == 401 and token is not None:
+		# Token has been revoked or expired early, get a fresh one & retry
+		headers.update(_auth_header(get_token(stale=token)))
+		response = send()
 	response.raise_for_status()
 	resp = json.loads(response.text)
 	return resp
@@ -35,7 +52,7 @@ def _auth_header(token: str) -> str:
 	return {'Authorization': 'bearer {}'.format(token)}
 
 
-def login() -> str:
+def _request_token() -> dict:
 	headers = {'Content-Type': 'application/x-www-form-urlencoded'}
 	data = {
 		'grant_type': 'client_credentials',
@@ -49,16 +66,52 @@ def login() -> str:
 		post=True
 	)
 
-	return resp['access_token']
+	return resp
+
+
+def login() -> str:
+	return _request_token()['access_token']
+
+
+def get_token(stale: str = None) -> str:
+	"""
+	Bearer token shared by all workers through Redis, only requesting a new one
+	once the cached token has expired. Passing the token which was just
+	rejected as `stale` forces it to be replaced.
+	"""
+	r = cache.get_redis()
+	token_key = cache.key('tcgplayer', 'token')
+
+	def cached_token():
+		token = r.get(token_key)
+		if token is not None:
+			token = token.decode()
+			if token != stale:
+				return token
+		return None
+
+	token = cached_token()
+	if token is not None:
+		return token
+
+	# Only one worker should request a new token at a time
+	with r.lock(token_key + ':lock', timeout=60, blocking_timeout=60):
+		token = cached_token()
+		if token is None:
+			resp = _request_token()
+			token = resp['access_token']
+			# Expire early so a token is never used right at its expiry
+			expires = max(int(resp.get('expires_in', 0)) - TOKEN_EXPIRY_MARGIN, 60)
+			r.set(token_key, token, ex=expires)
+	return token
 
 
 def search_categories(token: str = None) -> str:
 	if token is None:
-		token = login()
-	headers = _auth_header(token)
+		token = get_token()
 	resp = _send_request(
 		'/catalog/categories/1/search/manifest',
-		headers=headers
+		token=token
 	)
 	for r in resp['results'][0]['filters']:
 		if r['name'] == 'SetName':
@@ -68,15 +121,14 @@ def search_categories(token: str = None) -> str:
 
 def search(card, token=None):
 	if token is None:
-		token = login()
+		token = get_token()
 
 	productid = None
 	# check for multiface card format
 	if ' // ' in card['name']:
 		card['name'] = card['name'].split(' // ')[0]
 
-	headers = _auth_header(token)
-	headers['Content-Type'] = 'application/json'
+	headers = {'Content-Type': 'application/json'}
 	data = {
 		'filters': [
 			{
@@ -99,7 +151,8 @@ def search(card, token=None):
 		'/catalog/categories/1/search',
 		data=json.dumps(data),
 		headers=headers,
-		post=True
+		post=True,
+		token=token
 	)
 	search_results = resp['results']
 	if len(search_results) == 1:
@@ -111,7 +164,8 @@ def search(card, token=None):
 				','.join([str(r) for r in search_results])
 			),
 			params={'getExtendedFields': True},
-			headers=headers
+			headers=headers,
+			token=token
 		)
 		product_results = resp['results']
 		products_found = []
@@ -147,7 +201,8 @@ def search(card, token=None):
 			group_params = ','.join([str(r['groupId']) for r in products_found])
 			resp = _send_request(
 				'/catalog/groups/{}'.format(group_params),
-				headers=headers
+				headers=headers,
+				token=token
 			)
 			group_results = resp['results']
 			groups_found = []
@@ -187,18 +242,64 @@ def search(card, token=None):
 	return productid
 
 
+def get_group_products(groupid: int, token: str = None) -> list:
+	"""
+	Every product in a TCGplayer group (set), with the details needed to match
+	it to a printing locally.
+	"""
+	if token is None:
+		token = get_token()
+	products = []
+	offset = 0
+	while True:
+		resp = _send_request(
+			'/catalog/products',
+			params={
+				'groupId': groupid,
+				'getExtendedFields': True,
+				'offset': offset,
+				'limit': CATALOG_PAGE_SIZE
+			},
+			token=token
+		)
+		for r in resp['results']:
+			product = {
+				'productid': r['productId'],
+				'groupid': r['groupId'],
+				'name': r['name'],
+				'collectornumber': None,
+				'rarity': None,
+				'languages': None
+			}
+			for ex in r.get('extendedData', []):
+				if ex['name'] == 'Number':
+					# Older sets are numbered like 123/264
+					product['collectornumber'] = str(ex['value']).split('/')[0]
+				elif ex['name'] == 'Rarity':
+					product['rarity'] = ex['value']
+			if 'productConditions' in r:
+				product['languages'] = sorted({
+					pc['language'] for pc in r['productConditions']
+				})
+			products.append(product)
+
+		offset += len(resp['results'])
+		if len(resp['results']) == 0 or offset >= resp.get('totalItems', 0):
+			break
+	return products
+
+
 def get_price(cards: list, token: str = None) -> dict:
 	if token is None:
-		token = login()
+		token = get_token()
 	print('Fetching prices for {} cards.'.format(len(cards)))
 	if len(cards) == 0:
 		print('Ignoring 0 length')
 		return {}
-	headers = _auth_header(token)
 	card_params = ','.join([cards[cardid] for cardid in cards])
 	resp = _send_request(
 		'/pricing/product/{}'.format(card_params),
-		headers=headers
+		token=token
 	)
 	prices = {
 		cardid: {'normal': None, 'foil': None, 'type': None}